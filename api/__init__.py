@@ -1,6 +1,5 @@
 import os
 from flask import Flask
-from .logger import logger
 from flask_cors import CORS
 
 def create_app(test_config=None):
@@ -10,6 +9,62 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY='dev',
         DATABASE=os.path.join(app.instance_path, 'flaskr.sqlite'),
+        BATCH_MAX_RECORDS=5000,
+        FARMER_CACHE_SIZE=4096,
+        INGEST_ASYNC=False,
+        INGEST_QUEUE_DEPTH=10000,
+        INGEST_BATCH_SIZE=500,
+        INGEST_BATCH_INTERVAL=0.05,
+        INGEST_RETRY_AFTER=1,
+        RESPONSE_CACHE_SIZE=256,
+        OVERVIEW_THROUGHPUT_HOURS=24,
+        STREAM_POLL_INTERVAL=1,
+        STREAM_CLIENT_BUFFER=1000,
+        STREAM_MAX_CLIENTS=8,
+        STREAM_HEARTBEAT=15,
+        METRICS_DIR=None,
+        METRICS_FLUSH_INTERVAL=5,
+        SLOW_QUERY_THRESHOLD=0.1,
+        SLOW_QUERY_LOG_SIZE=100,
+        STATISTICS_INTERVAL=600,
+        EVENT_RETENTION={},
+        EVENT_RETENTION_INTERVAL=300,
+        EVENT_RETENTION_BATCH_SIZE=1000,
+        EVENT_RETENTION_BATCH_PAUSE=0.01,
+        EVENT_RETENTION_VACUUM_PAGES=10000,
+        EVENT_DATA_INDEXES=[],
+        EVENT_ARCHIVE_DIR=None,
+        EVENT_ARCHIVE_AFTER_DAYS=21,
+        EVENT_ARCHIVE_INTERVAL=3600,
+        EVENT_ARCHIVE_MAX_SEGMENTS=31,
+        EVENT_ARCHIVE_MAX_ROWS=200000,
+        EVENTS_DATABASE=None,
+        EVENTS_CHECKPOINT_INTERVAL=30,
+        EVENTS_SQLITE_PRAGMAS={
+            'auto_vacuum': 'INCREMENTAL',
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': 268435456,
+            'cache_size': -8000
+        },
+        READ_REPLICA=None,
+        READ_REPLICA_PATH=None,
+        READ_REPLICA_INTERVAL=5,
+        READ_REPLICA_MAX_STALENESS=30,
+        SQLITE_PERSISTENT_CONNECTIONS=True,
+        SQLITE_CACHED_STATEMENTS=512,
+        SQLITE_PRAGMAS={
+            # Only takes effect on a new database; `flask enable-incremental-vacuum` converts existing ones
+            'auto_vacuum': 'INCREMENTAL',
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': 268435456,
+            # Per connection, and each thread keeps one open
+            'cache_size': -8000,
+            'temp_store': 'MEMORY',
+            # Sectors reference farmer_id 'Unknown' before the farm is registered
+            'foreign_keys': 'OFF'
+        },
     )
 
     if test_config is None:
@@ -25,20 +80,51 @@ def create_app(test_config=None):
     except OSError:
         pass
     
+    from . import metrics
+    metrics.init_app(app)
+
     from . import db
     db.init_app(app)
 
-    # If the database needs to be initialized, initialize it.
-    db_path = app.config['DATABASE']
-    
-    # Uncomment to drop DB before each run
+    # Bring the database schema up to date
     with app.app_context():
-        db.init_db()
+        db.migrate_db()
+
+    from . import events_db
+    events_db.init_app(app)
+
+    from . import event_data
+    event_data.init_app(app)
+
+    from . import catalog
+    catalog.init_app(app)
+
+    from . import sector_tracker
+    sector_tracker.init_app(app)
+
+    from . import farmer_cache
+    farmer_cache.init_app(app)
+
+    from . import ingest_queue
+    ingest_queue.init_app(app)
+
+    from . import response_cache
+    response_cache.init_app(app)
+
+    from . import event_stream
+    event_stream.init_app(app)
+
+    from . import archive
+    archive.init_app(app)
+
+    from . import retention
+    retention.init_app(app)
+
+    from . import replica
+    replica.init_app(app)
 
-    if not os.path.exists(db_path):
-        logger.info('Initializing DB')
-        with app.app_context():
-            db.init_db()
+    from . import table_stats
+    table_stats.init_app(app)
 
     from . import api_routes
     app.register_blueprint(api_routes.api_routes)
@@ -1,123 +1,595 @@
+import base64
 import json
 
 from datetime import datetime
-from .db import get_db
+from .archive import archive_source, get_event_archive, window_segments
+from .catalog import get_catalog
+from .db import get_db, sha256
+from . import event_data, farmer_cache, metrics
 from .logger import logger
+from .sector_tracker import get_sector_tracker
+
+# Rollup bucket sizes and the strftime format that truncates a timestamp to each
+ROLLUP_BUCKETS = {
+    'minute': '%Y-%m-%d %H:%M:00',
+    'hour': '%Y-%m-%d %H:00:00'
+}
+
+# Rows pulled from SQLite per step while streaming an export
+EXPORT_FETCH_SIZE = 500
+
+# Distinct (entity, filters, sort) query shapes kept compiled
+QUERY_CACHE_SIZE = 256
+
+# Filter operators accepted as a column__operator suffix, and the SQL they compile to
+FILTER_OPERATORS = {
+    'eq': '=',
+    'ne': '!=',
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+    'in': 'IN',
+    'between': 'BETWEEN',
+    # GLOB is case sensitive, so unlike LIKE it can use an index for the prefix
+    'prefix': 'GLOB'
+}
+
+# Values accepted by a single __in filter
+FILTER_IN_MAX_VALUES = 500
+
+# Columns whose per-value row counts are kept in row_counters by triggers (migration 0010)
+COUNTED_COLUMNS = {
+    'events': ['event_level', 'event_type'],
+    'containers': ['container_type', 'container_status'],
+    'farmers': ['farmer_status'],
+    'farms': ['farmer_id'],
+    'sectors': ['complete', 'farmer_id', 'plotter_id']
+}
+
+# Rebuilds the fleet_overview rows of the farmers matching {condition} (migration 0011)
+OVERVIEW_REFRESH = """
+    INSERT OR REPLACE INTO fleet_overview (
+        farmer_id, container_id, farmer_status, farmer_reward_address,
+        container_alias, container_type, container_status, container_image, container_ip, container_started_at,
+        farm_count, farms_plotted, plot_progress, farms
+    )
+    SELECT
+        farmers.farmer_id, farmers.container_id, farmers.farmer_status, farmers.farmer_reward_address,
+        containers.container_alias, containers.container_type, containers.container_status,
+        containers.container_image, containers.container_ip, containers.container_started_at,
+        (SELECT COUNT(*) FROM farms WHERE farms.farmer_id = farmers.farmer_id),
+        (SELECT COUNT(*) FROM farms WHERE farms.farmer_id = farmers.farmer_id AND farm_initial_plot_complete = 1),
+        (SELECT AVG(farm_plot_progress) FROM farms WHERE farms.farmer_id = farmers.farmer_id),
+        (
+            SELECT json_group_array(json_object(
+                'farm_index', farm_index,
+                'farm_id', farm_id,
+                'farm_public_key', farm_public_key,
+                'farm_size', farm_size,
+                'farm_initial_plot_complete', farm_initial_plot_complete,
+                'farm_plot_progress', farm_plot_progress,
+                'farm_latest_sector', farm_latest_sector,
+                'updated_at', updated_at
+            ))
+            FROM (SELECT * FROM farms WHERE farms.farmer_id = farmers.farmer_id ORDER BY farm_index)
+        )
+    FROM farmers
+    LEFT JOIN containers ON containers.container_id = farmers.container_id
+    WHERE {condition}
+"""
+
+# Longest sector throughput window /get/overview accepts, in hours
+OVERVIEW_MAX_HOURS = 168
+
+
+def encode_cursor(sort_column, sort_order, value, rowid):
+    # Timestamp columns come back as datetimes; store them the way SQLite does
+    if isinstance(value, datetime):
+        value = value.isoformat(' ')
+
+    payload = json.dumps([sort_column, sort_order, value, rowid], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+    if not isinstance(payload, list) or len(payload) != 4 or not isinstance(payload[3], int):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+    return payload
+
+
+def keyset_clause(sort_column, sort_order, null_value):
+    # A row value comparison, unlike the equivalent ORs, lets SQLite seek the sort
+    # column's index. NULLs never compare, so they are paged through on their own.
+    operator = '>' if sort_order == 'ASC' else '<'
+    if null_value:
+        return f"{sort_column} IS NULL AND rowid {operator} ?"
+    return f"({sort_column}, rowid) {operator} (?, ?)"
+
+
+def keyset_remainder(sort_column, sort_order, null_value):
+    # SQLite sorts NULLs first, so they come before every value ascending and after every value
+    # descending. Returns the rows past the keyset's own region, or None when there are none.
+    if null_value and sort_order == 'ASC':
+        return f"{sort_column} IS NOT NULL"
+    if not null_value and sort_order == 'DESC':
+        return f"{sort_column} IS NULL"
+    return None
+
+
+def keyset_values(value, rowid):
+    if value is None:
+        return [rowid]
+    return [value, rowid]
+
+
+def escape_glob(value):
+    # Wrapping a wildcard in brackets matches it literally
+    return ''.join(f'[{char}]' if char in '*?[' else char for char in value)
+
+
+def filter_clause(column, operator, arity):
+    if operator == 'IN':
+        return f"{column} IN ({', '.join('?' * arity)})"
+    if operator == 'BETWEEN':
+        return f"{column} BETWEEN ? AND ?"
+    return f"{column} {operator} ?"
+
+
+def filter_query(filter_spec, extra_clauses=()):
+    # filter_spec holds (column or expression, operator, number of values) for each filter
+    filter_clauses = [filter_clause(column, operator, arity) for column, operator, arity in filter_spec]
+    filter_clauses.extend(extra_clauses)
+
+    if not filter_clauses:
+        return ""
+    return f"WHERE {' AND '.join(filter_clauses)}"
+
+
+def compile_entity_query(catalog, entity, filter_spec, sort_column, sort_order, keyset, archived=False):
+    # keyset is None for offset paging, otherwise 'null' or 'value' depending on the cursor's sort value.
+    # archived reads events from the hot table and the attached archive segments together.
+    # remainder_query, if not None, continues a cursor page that ran out of rows in the keyset's
+    # region (values or NULLs) into the other one.
+    source = archive_source(catalog.columns(entity)) if archived else entity
+    count_query = f"SELECT COUNT(*) FROM {source} {filter_query(filter_spec)}"
+
+    keyset_clauses = []
+    remainder_query = None
+    # Order by rowid as well so rows with equal sort values have a stable position
+    order_clause = f"ORDER BY {sort_column} {sort_order}, rowid {sort_order}"
+    if keyset is not None:
+        keyset_clauses.append(keyset_clause(sort_column, sort_order, keyset == 'null'))
+
+        remainder = keyset_remainder(sort_column, sort_order, keyset == 'null')
+        if remainder is not None and catalog.nullable(entity, sort_column):
+            remainder_query = f"SELECT rowid AS _cursor_rowid, * FROM {source} {filter_query(filter_spec, [remainder])} {order_clause} LIMIT ?"
+
+    paginated_query = f"SELECT rowid AS _cursor_rowid, * FROM {source} {filter_query(filter_spec, keyset_clauses)} {order_clause} LIMIT ? OFFSET ?"
+
+    return count_query, paginated_query, remainder_query
+
 
 class APIDB:
-    @staticmethod
-    def get_entity(entity, page, limit, filters, start, end, sort_column, sort_order):
-        db = get_db()
-        logger.info(f"Grabbing data for {entity} table")
+    REQUIRED_FIELDS = {
+        'event': [
+            'event_name', 'event_type', 'event_level', 'event_container_alias',
+            'event_container_id', 'event_container_type', 'event_datetime'
+        ],
+        'container': [
+            'container_id', 'container_type', 'container_alias', 'container_status', 'container_image', 'container_started_at', 'container_is_cluster', 'container_ip'
+        ],
+        'farmer': [
+            'farmer_id', 'container_id', 'farmer_status'
+        ],
+        'farm': [
+            'farmer_id', 'farm_index'
+        ],
+        'incomplete_sector': [
+            'sector_index', 'public_key', 'complete', 'plotter_id', 'event_datetime'
+        ],
+        'complete_sector': [
+            'sector_index', 'public_key', 'complete', 'plotter_id', 'event_datetime'
+        ]
+    }
 
-        # Validation
-        if entity not in ['events', 'containers', 'farmers', 'farms', 'sectors']:
-            return {
-                "message": f"Invalid entity name: {entity}", 
-                'status_code': 400
-            }
-        
-        if page <= 0 or limit <= 0:
-            return {
-                "message": f"Page and limit must be positive integers", 
-                'status_code': 400
-            }
-        
-        if not sort_column:
+    @staticmethod
+    def validate(entity, data):
+        if not isinstance(data, dict):
             return {
-                "message": f"Sort column is required", 
+                "message": "Record must be a JSON object",
                 'status_code': 400
             }
-        
-        # Get columns from the database schema (this should be cached or validated against known columns)
-        table_columns = [row['name'] for row in db.execute(f"PRAGMA table_info({entity})").fetchall()]
-        if sort_column not in table_columns:
+
+        # Check for missing fields. Events treat empty values as missing.
+        if entity == 'event':
+            missing_fields = [field for field in APIDB.REQUIRED_FIELDS[entity] if not data.get(field)]
+        else:
+            missing_fields = [field for field in APIDB.REQUIRED_FIELDS[entity] if field not in data or data[field] is None]
+
+        if missing_fields:
             return {
-                "message": f"Invalid sort_column: {sort_column}", 
+                "message": f"Missing fields: {', '.join(missing_fields)}",
                 'status_code': 400
             }
 
-        # Build the filtering query
-        filter_clauses = []
-        filter_values = []
+        # Extract and validate event_datetime
+        if entity == 'event':
+            try:
+                datetime.strptime(data['event_datetime'], '%Y-%m-%d %H:%M:%S')
+            except (TypeError, ValueError):
+                return {
+                    "message": f"Invalid datetime format: {data['event_datetime']}",
+                    'status_code': 400
+                }
 
+        return None
+
+    @staticmethod
+    def insert_batch(entity, records):
+        logger.info(f"Inserting batch of {len(records)} {entity} records")
+        return APIDB.insert_records([(entity, record) for record in records])
+
+    @staticmethod
+    def insert_records(records):
+        # Validate everything up front so invalid records never touch the transaction
+        results = [APIDB.validate(entity, record) for entity, record in records]
+
+        db = get_db()
+
+        # Apply every valid record in a single transaction. Each record gets its own
+        # savepoint so a failure only discards that record's writes.
+        try:
+            db.begin(*{INSERT_TABLES[entity] for entity, _ in records})
+
+            for index, (entity, record) in enumerate(records):
+                if results[index]:
+                    continue
+
+                db.execute("SAVEPOINT batch_record")
+                try:
+                    results[index] = INSERT_METHODS[entity](record, commit=False)
+                except Exception as e:
+                    db.execute("ROLLBACK TO batch_record")
+                    logger.error(f'Error inserting {entity} record {index}: {e}')
+                    results[index] = {"message": f"Internal Server Error: {str(e)}", 'status_code': 500}
+                db.execute("RELEASE batch_record")
+
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        return [{'index': index, **result} for index, result in enumerate(results)]
+
+    @staticmethod
+    def column_value(column_type, value):
+        # A filter value as the column's affinity would convert it. Filters bind the raw
+        # string and let SQLite do this; row_counters.column_value is untyped, so lookups there can't.
+        if any(name in column_type for name in ('CHAR', 'CLOB', 'TEXT', 'BLOB')) or not column_type:
+            return value
+        for parse in (int, float):
+            try:
+                return parse(value)
+            except ValueError:
+                pass
+        return value
+
+    @staticmethod
+    def build_filters(entity, table_columns, filters, start, end, time_column=None):
+        filter_spec = []
+        filter_values = []
 
         if filters:
-            for column, value in filters.items():
+            for key, value in filters.items():
+                column, _, operator = key.rpartition('__')
+                if operator not in FILTER_OPERATORS:
+                    column, operator = key, 'eq'
+
                 if column in table_columns:  # Ensure the filter column exists
-                    filter_clauses.append(f"{column} = ?")
-                    filter_values.append(value)
+                    # Bound as given; the column's affinity converts it for the comparison
+                    expression = column
+                    convert = None
+                elif entity == 'events' and column.startswith(event_data.FILTER_PREFIX):
+                    path = column[len(event_data.FILTER_PREFIX):]
+                    if not event_data.PATH.match(path):
+                        return {
+                            "message": f"Invalid event_data path: {path}",
+                            'status_code': 400
+                        }, None, None
+
+                    expression = event_data.filter_expression(path, table_columns)
+                    convert = event_data.parse_value
                 else:
                     return {
                         "message": f"Invalid filter column: {column}",
                         'status_code': 400
-                    }
+                    }, None, None
+
+                values = value.split(',') if operator in ('in', 'between') else [value]
+                if operator == 'between' and len(values) != 2:
+                    return {
+                        "message": f"{key} takes two comma separated values",
+                        'status_code': 400
+                    }, None, None
+
+                if operator == 'in' and len(values) > FILTER_IN_MAX_VALUES:
+                    return {
+                        "message": f"{key} takes at most {FILTER_IN_MAX_VALUES} values",
+                        'status_code': 400
+                    }, None, None
+
+                if convert is not None:
+                    values = [convert(value) for value in values]
+
+                if operator == 'prefix':
+                    values = [escape_glob(str(values[0])) + '*']
+
+                filter_spec.append((expression, FILTER_OPERATORS[operator], len(values)))
+                filter_values.extend(values)
+
+        # start/end bound the time column, event_datetime unless another is asked for
+        if time_column is None and entity == 'events':
+            time_column = 'event_datetime'
+
+        if time_column is not None and (start or end):
+            column_type = table_columns.get(time_column)
+            if column_type is None or not ('DATE' in column_type or 'TIME' in column_type):
+                return {
+                    "message": f"Invalid time_column: {time_column}",
+                    'status_code': 400
+                }, None, None
 
-        # Add time filtering for 'events' entity
-        if entity == 'events':
             if start:
-                filter_clauses.append("event_datetime >= ?")
+                filter_spec.append((time_column, '>=', 1))
                 filter_values.append(start)
             if end:
-                filter_clauses.append("event_datetime <= ?")
+                filter_spec.append((time_column, '<=', 1))
                 filter_values.append(end)
 
+        return None, tuple(filter_spec), filter_values
+
+    @staticmethod
+    def export_entity(entity, filters, start, end, time_column=None):
+        db = get_db()
+        logger.info(f"Exporting data for {entity} table")
 
-        # Construct the filter query string
-        filter_query = " AND ".join(filter_clauses)
-        if filter_query:
-            filter_query = f"WHERE {filter_query}"
+        table_columns = get_catalog().columns(entity)
+        if table_columns is None:
+            return {
+                "message": f"Invalid entity name: {entity}",
+                'status_code': 400
+            }
 
+        error, filter_spec, filter_values = APIDB.build_filters(entity, table_columns, filters, start, end, time_column)
+        if error:
+            return error
 
-        # Get the total number of rows
-        total_query = f"SELECT COUNT(*) FROM {entity} {filter_query}"
-        total_rows = db.execute(total_query, filter_values).fetchone()[0]
+        archive, segments = window_segments(entity, filter_spec, filter_values, start, end, time_column)
 
-        # Determine if ordering is needed based on entity type
-        order_clause = f"ORDER BY {sort_column} {sort_order}" if sort_column else ""
+        def fetch(query):
+            cursor = db.execute(query, filter_values, name='entity_export')
+            try:
+                while True:
+                    chunk = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                    if not chunk:
+                        return
 
-        # Get the paginated results
-        offset = (page - 1) * limit
-        paginated_query = f"SELECT * FROM {entity} {filter_query} {order_clause} LIMIT ? OFFSET ?"
-        rows = db.execute(paginated_query, filter_values + [limit, offset]).fetchall()
+                    metrics.registry.inc('spaceport_db_rows_total', (('query', 'entity_export'),), len(chunk))
+                    yield chunk
+            finally:
+                cursor.close()
 
+        # Walk the table in rowid order, holding only one fetch's worth of rows at a time.
+        # Archived events come first, one segment at a time.
+        def rows():
+            for segment in segments:
+                archive.attach(db, [segment])
+                yield from fetch(f"SELECT * FROM temp.archived_events {filter_query(filter_spec)} ORDER BY event_id")
 
-        # Convert rows to dictionary
-        result = [dict(row) for row in rows]
+            yield from fetch(f"SELECT * FROM {entity} {filter_query(filter_spec)} ORDER BY rowid")
 
         return {
-            'data': result,
-            'total_rows': total_rows,
-            'page': page,
-            'limit': limit
+            'columns': list(table_columns),
+            'rows': rows(),
+            'status_code': 200
         }
 
     @staticmethod
-    def insert_event(data):
+    def count_rows(entity, table_columns, filter_spec, filter_values):
+        # No filter, or a single = / IN filter on a counted column, is read from row_counters.
+        # Returns None for anything else so the caller falls back to COUNT(*).
+        if not filter_spec:
+            column, values = '', ['']
+        elif len(filter_spec) == 1 and filter_spec[0][0] in COUNTED_COLUMNS.get(entity, []) and filter_spec[0][1] in ('=', 'IN'):
+            column = filter_spec[0][0]
+            values = list({APIDB.column_value(table_columns[column], value) for value in filter_values})
+        else:
+            return None
 
-        REQUIRED_FIELDS = [
-            'event_name', 'event_type', 'event_level', 'event_container_alias', 
-            'event_container_id', 'event_container_type', 'event_datetime'
-        ]
+        db = get_db()
+        return db.execute(
+            f"""
+            SELECT COALESCE(SUM(row_count), 0) FROM {db.schema(entity)}.row_counters
+            WHERE table_name = ? AND column_name = ? AND column_value IN ({', '.join('?' * len(values))})
+            """,
+            [entity, column] + values,
+            name='row_counter_lookup'
+        ).fetchone()[0]
 
-        # Check for missing fields
-        missing_fields = [field for field in REQUIRED_FIELDS if not data.get(field)]
+    @staticmethod
+    def event_backlog(filter_spec, filter_values, after, until, limit):
+        # Events a resuming stream client missed, oldest first
+        return get_db().execute(
+            f"""
+            SELECT * FROM events
+            {filter_query(filter_spec, ['event_id > ?', 'event_id <= ?'])}
+            ORDER BY event_id
+            LIMIT ?
+            """,
+            list(filter_values) + [after, until, limit],
+            name='event_stream_backlog'
+        ).fetchall()
 
-        if missing_fields:
+    @staticmethod
+    def get_generation(entity):
+        db = get_db()
+        row = db.execute(
+            f"SELECT generation FROM {db.schema(entity)}.table_generations WHERE table_name = ?",
+            (entity,),
+            name='table_generation_lookup'
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        return row['generation']
+
+    @staticmethod
+    def get_entity(entity, page, limit, filters, start, end, sort_column, sort_order, cursor=None, include_total=None, time_column=None):
+        db = get_db()
+        logger.info(f"Grabbing data for {entity} table")
+
+        # Validation
+        table_columns = get_catalog().columns(entity)
+        if table_columns is None:
+            return {
+                "message": f"Invalid entity name: {entity}", 
+                'status_code': 400
+            }
+        
+        if page <= 0 or limit <= 0:
             return {
-                "message": f"Missing fields: {', '.join(missing_fields)}", 
+                "message": f"Page and limit must be positive integers", 
+                'status_code': 400
+            }
+        
+        if not sort_column:
+            return {
+                "message": f"Sort column is required", 
                 'status_code': 400
             }
 
-        # Extract and validate event_datetime
-        try:
-            event_datetime = datetime.strptime(data['event_datetime'], '%Y-%m-%d %H:%M:%S')
-        except ValueError:
+        sort_order = sort_order.upper()
+        if sort_order not in ['ASC', 'DESC']:
             return {
-                "message": f"Invalid datetime format: {data['event_datetime']}", 
+                "message": f"Invalid sort_order: {sort_order}",
+                'status_code': 400
+            }
+        
+        if sort_column not in table_columns:
+            return {
+                "message": f"Invalid sort_column: {sort_column}", 
                 'status_code': 400
             }
 
+        # Build the filtering query
+        error, filter_spec, filter_values = APIDB.build_filters(entity, table_columns, filters, start, end, time_column)
+        if error:
+            return error
+
+        # Continue after the last row of the previous page (keyset pagination)
+        keyset = None
+        page_values = list(filter_values)
+        offset = (page - 1) * limit
+        if cursor:
+            try:
+                cursor_column, cursor_order, cursor_value, cursor_rowid = decode_cursor(cursor)
+            except ValueError:
+                return {
+                    "message": f"Invalid cursor: {cursor}",
+                    'status_code': 400
+                }
+
+            if cursor_column != sort_column or cursor_order != sort_order:
+                return {
+                    "message": "Cursor does not match sort_column and sort_order",
+                    'status_code': 400
+                }
+
+            keyset = 'null' if cursor_value is None else 'value'
+            page_values.extend(keyset_values(cursor_value, cursor_rowid))
+            offset = 0
+        elif cursor is not None:
+            offset = 0
+
+        # Events older than the archive horizon are read from their segments when the window reaches them
+        archived = False
+        archive, segments = window_segments(entity, filter_spec, filter_values, start, end, time_column)
+        if segments:
+            error = archive.window_error(segments)
+            if error:
+                return {
+                    "message": error,
+                    'status_code': 400
+                }
+
+            archive.attach(db, segments)
+            archived = True
+
+        count_query, paginated_query, remainder_query = get_catalog().compile_query(entity, filter_spec, sort_column, sort_order, keyset, archived)
+
+        # Paging by cursor skips the COUNT(*) unless the caller asks for it
+        if include_total is None:
+            include_total = cursor is None
+
+        # Get the total number of rows
+        total_rows = None
+        if include_total:
+            # Archived rows aren't in the counters
+            if not archived:
+                total_rows = APIDB.count_rows(entity, table_columns, filter_spec, filter_values)
+            if total_rows is None:
+                total_rows = db.execute(count_query, filter_values, name='entity_count').fetchone()[0]
+
+        # Get the paginated results. One extra row tells us whether there is a next page.
+        rows = db.execute(paginated_query, page_values + [limit + 1, offset], name='entity_page').fetchall()
+        if remainder_query is not None and len(rows) <= limit:
+            rows += db.execute(remainder_query, filter_values + [limit + 1 - len(rows)], name='entity_page').fetchall()
+        metrics.registry.inc('spaceport_db_rows_total', (('query', 'entity_page'),), len(rows))
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(sort_column, sort_order, last[sort_column], last['_cursor_rowid'])
+
+        # Convert rows to dictionary
+        result = []
+        for row in rows:
+            row = dict(row)
+            del row['_cursor_rowid']
+            row.pop('rowid', None)
+            result.append(row)
+
+        response = {
+            'data': result,
+            'limit': limit,
+            'next_cursor': next_cursor
+        }
+
+        if cursor is None:
+            response['page'] = page
+
+        if include_total:
+            response['total_rows'] = total_rows
+
+        return response
+
+    @staticmethod
+    def insert_event(data, commit=True):
+        error = APIDB.validate('event', data)
+        if error:
+            return error
+
+        event_datetime = datetime.strptime(data['event_datetime'], '%Y-%m-%d %H:%M:%S')
+
         # Extract Data
         event_name = data.get('event_name')
         event_type = data.get('event_type')
@@ -127,24 +599,16 @@ class APIDB:
         event_container_type = data.get('event_container_type')
         event_data = json.dumps(data.get('event_data', {}))
 
-        db = get_db()
+        archive = get_event_archive()
+        if archive is not None and archive.contains(event_container_id, str(event_datetime), sha256(event_data)):
+            return {'message': 'Event already exists', 'status_code': 200}
 
-        # Check for duplicates
-        response = db.execute(
-            '''
-            SELECT COUNT(*) FROM events 
-            WHERE event_container_id = ? 
-            AND event_data = ? 
-            AND event_datetime = ?
-            ''', 
-            (event_container_id, event_data, event_datetime)
-        ).fetchone()
+        db = get_db()
+        db.begin('events')
 
-        if response[0] > 0:
-            return {'message': 'Event already exists', 'status_code': 200}
-        
-        # Insert the data into the database
-        db.execute(
+        # Insert the data into the database. The unique index on the content hash
+        # makes duplicates a no-op instead of requiring a lookup first.
+        cursor = db.execute(
             '''
             INSERT INTO events (
                 event_name,
@@ -154,9 +618,11 @@ class APIDB:
                 event_container_id,
                 event_container_type,
                 event_data,
+                event_data_hash,
                 event_datetime
             ) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (event_container_id, event_datetime, event_data_hash) DO NOTHING
             ''', 
             (
                 event_name,
@@ -166,28 +632,30 @@ class APIDB:
                 event_container_id,
                 event_container_type,
                 event_data,
+                sha256(event_data),
                 event_datetime
-            )
+            ), name='event_dedup_insert'
         )
-        db.commit()
 
-        return {'message': 'Event inserted successfully', 'status_code': 201}
+        if cursor.rowcount == 0:
+            if commit:
+                db.commit()
 
+            return {'message': 'Event already exists', 'status_code': 200}
 
-    @staticmethod
-    def insert_container(data):
-        REQUIRED_FIELDS = [
-            'container_id', 'container_type', 'container_alias', 'container_status', 'container_image', 'container_started_at', 'container_is_cluster', 'container_ip'
-        ]
+        db.touch('events')
 
-        # Check for missing fields
-        missing_fields = [field for field in REQUIRED_FIELDS if field not in data or data[field] is None]
+        if commit:
+            db.commit()
 
-        if missing_fields:
-            return {
-                "message": f"Missing fields: {', '.join(missing_fields)}", 
-                'status_code': 400
-            }
+        return {'message': 'Event inserted successfully', 'status_code': 201}
+
+
+    @staticmethod
+    def insert_container(data, commit=True):
+        error = APIDB.validate('container', data)
+        if error:
+            return error
         
         # Extract Data
         container_id = data.get('container_id')
@@ -200,44 +668,38 @@ class APIDB:
         container_nats_url = data.get('container_nats_url', None)
         container_ip = data.get('container_ip')
 
+        # Insert or update in one statement. revision is only bumped by the update
+        # branch, so 0 means the row was just created.
         db = get_db()
-        exists = db.execute("SELECT COUNT(*) FROM containers WHERE container_id = ?", (container_id,)).fetchone()[0] > 0
-
-        if exists:
-            # Update existing row
-            db.execute("""
-                UPDATE containers 
-                SET container_type = ?, container_alias = ?, container_status = ?, container_image = ?, container_started_at = ?, 
-                    container_is_cluster = ?, container_nats_url = ?, container_ip = ?
-                WHERE container_id = ?
-            """, (container_type, container_alias, container_status, container_image, container_started_at, container_is_cluster, container_nats_url, container_ip, container_id))
-            db.commit()
-            return {"message": "Updated Container", "status_code": 200}
-        
-        else:
-            # Create new row
-            db.execute("""
-                INSERT INTO containers (container_id, container_type, container_alias, container_status, container_image, 
-                                        container_started_at, container_is_cluster, container_nats_url, container_ip)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (container_id, container_type, container_alias, container_status, container_image, container_started_at, container_is_cluster, container_nats_url, container_ip))
+        db.begin('containers')
+        revision = db.execute("""
+            INSERT INTO containers (container_id, container_type, container_alias, container_status, container_image, 
+                                    container_started_at, container_is_cluster, container_nats_url, container_ip)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (container_id) DO UPDATE
+            SET container_type = excluded.container_type, container_alias = excluded.container_alias,
+                container_status = excluded.container_status, container_image = excluded.container_image,
+                container_started_at = excluded.container_started_at, container_is_cluster = excluded.container_is_cluster,
+                container_nats_url = excluded.container_nats_url, container_ip = excluded.container_ip,
+                updated_at = CURRENT_TIMESTAMP, revision = revision + 1
+            RETURNING revision
+        """, (container_id, container_type, container_alias, container_status, container_image, container_started_at, container_is_cluster, container_nats_url, container_ip), name='container_upsert').fetchone()[0]
+        db.touch('containers')
+        APIDB.refresh_overview('farmers.container_id = ?', container_id)
+
+        if commit:
             db.commit()
-            return {'message': 'Inserted Container', 'status_code': 201}
 
-    @staticmethod
-    def insert_farmer(data):
-        REQUIRED_FIELDS = [
-            'farmer_id', 'container_id', 'farmer_status'
-        ]
+        if revision:
+            return {"message": "Updated Container", "status_code": 200}
 
-        # Check for missing fields
-        missing_fields = [field for field in REQUIRED_FIELDS if field not in data or data[field] is None]
+        return {'message': 'Inserted Container', 'status_code': 201}
 
-        if missing_fields:
-            return {
-                "message": f"Missing fields: {', '.join(missing_fields)}", 
-                'status_code': 400
-            }
+    @staticmethod
+    def insert_farmer(data, commit=True):
+        error = APIDB.validate('farmer', data)
+        if error:
+            return error
         
         farmer_id = data.get('farmer_id')
         container_id = data.get('container_id')
@@ -245,40 +707,32 @@ class APIDB:
         farmer_reward_address = data.get('farmer_reward_address', None)
 
         db = get_db()
-        exists = db.execute("SELECT COUNT(*) FROM farmers WHERE farmer_id = ?", (farmer_id,)).fetchone()[0] > 0
-
-        if exists:
-            # Update existing row
-            db.execute("""
-                UPDATE farmers 
-                SET container_id = ?, farmer_status = ?, farmer_reward_address = ?
-                WHERE farmer_id = ?
-            """, (container_id, farmer_status, farmer_reward_address, farmer_id))
+        db.begin('farmers')
+        revision = db.execute("""
+            INSERT INTO farmers (farmer_id, container_id, farmer_status, farmer_reward_address)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (farmer_id) DO UPDATE
+            SET container_id = excluded.container_id, farmer_status = excluded.farmer_status,
+                farmer_reward_address = excluded.farmer_reward_address,
+                updated_at = CURRENT_TIMESTAMP, revision = revision + 1
+            RETURNING revision
+        """, (farmer_id, container_id, farmer_status, farmer_reward_address), name='farmer_upsert').fetchone()[0]
+        db.touch('farmers')
+        APIDB.refresh_overview('farmers.farmer_id = ?', farmer_id)
+
+        if commit:
             db.commit()
+
+        if revision:
             return {"message": "Updated Farmer", "status_code": 200}
-        
-        else:
-            # Create new row
-            db.execute("""
-                INSERT INTO farmers (farmer_id, container_id, farmer_status, farmer_reward_address)
-                VALUES (?, ?, ?, ?)
-            """, (farmer_id, container_id, farmer_status, farmer_reward_address))
-            db.commit()
-            return {'message': 'Inserted Farmer', 'status_code': 201}
+
+        return {'message': 'Inserted Farmer', 'status_code': 201}
         
     @staticmethod
-    def insert_farm(data):
-        REQUIRED_FIELDS = [
-            'farmer_id', 'farm_index'
-        ]
-
-        # Check for missing fields
-        missing_fields = [field for field in REQUIRED_FIELDS if field not in data or data[field] is None]
-        if missing_fields:
-            return {
-                "message": f"Missing fields: {', '.join(missing_fields)}",
-                'status_code': 400
-            }
+    def insert_farm(data, commit=True):
+        error = APIDB.validate('farm', data)
+        if error:
+            return error
         
         farmer_id = data.get('farmer_id')
         farm_index = data.get('farm_index')
@@ -293,21 +747,47 @@ class APIDB:
         farm_latest_sector = data.get('farm_latest_sector')
 
         db = get_db()
-        exists = db.execute(
-            "SELECT COUNT(*) FROM farms WHERE farmer_id = ? AND farm_index = ?",
-            (farmer_id, farm_index)
-        ).fetchone()[0] > 0
-
-        if not exists:
-            # Insert a new record if the farm does not exist
-            query = """
+        db.begin('farms')
+
+        # Resolve the key's current owner first so resending an unchanged key
+        # doesn't invalidate every worker's farmer_id cache
+        previous_farmer_id = None
+        if farm_public_key is not None:
+            previous_farmer_id = farmer_cache.lookup_farmer_id(db, farm_public_key)
+
+        # Insert the farm, or update only the fields that were provided. The WHERE
+        # clause skips the update (and returns no row) when nothing was provided.
+        row = db.execute(
+            """
             INSERT INTO farms (
                 farmer_id, farm_index, farm_id, farm_public_key, farm_genesis_hash,
                 farm_size, farm_directory, farm_fastest_mode, farm_initial_plot_complete,
                 farm_plot_progress, farm_latest_sector
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """
-            values = [
+            ON CONFLICT (farmer_id, farm_index) DO UPDATE
+            SET farm_id = COALESCE(excluded.farm_id, farm_id),
+                farm_public_key = COALESCE(excluded.farm_public_key, farm_public_key),
+                farm_genesis_hash = COALESCE(excluded.farm_genesis_hash, farm_genesis_hash),
+                farm_size = COALESCE(excluded.farm_size, farm_size),
+                farm_directory = COALESCE(excluded.farm_directory, farm_directory),
+                farm_fastest_mode = COALESCE(excluded.farm_fastest_mode, farm_fastest_mode),
+                farm_initial_plot_complete = COALESCE(excluded.farm_initial_plot_complete, farm_initial_plot_complete),
+                farm_plot_progress = COALESCE(excluded.farm_plot_progress, farm_plot_progress),
+                farm_latest_sector = COALESCE(excluded.farm_latest_sector, farm_latest_sector),
+                updated_at = CURRENT_TIMESTAMP,
+                revision = revision + 1
+            WHERE excluded.farm_id IS NOT NULL
+                OR excluded.farm_public_key IS NOT NULL
+                OR excluded.farm_genesis_hash IS NOT NULL
+                OR excluded.farm_size IS NOT NULL
+                OR excluded.farm_directory IS NOT NULL
+                OR excluded.farm_fastest_mode IS NOT NULL
+                OR excluded.farm_initial_plot_complete IS NOT NULL
+                OR excluded.farm_plot_progress IS NOT NULL
+                OR excluded.farm_latest_sector IS NOT NULL
+            RETURNING revision
+            """,
+            (
                 farmer_id,
                 farm_index,
                 farm_id,
@@ -319,164 +799,244 @@ class APIDB:
                 farm_initial_plot_complete,
                 farm_plot_progress,
                 farm_latest_sector
-            ]
+            ), name='farm_upsert'
+        ).fetchone()
 
-            db.execute(query, values)
-            db.commit()
-            return {'message': 'Farm inserted successfully', 'status_code': 201}
-        
+        if row is not None:
+            db.touch('farms')
+            APIDB.refresh_overview('farmers.farmer_id = ?', farmer_id)
 
-        else:
-            # Prepare the SQL query with dynamic fields for update
-            fields_to_update = []
-            values = []
-
-            if farm_id is not None:
-                fields_to_update.append("farm_id = ?")
-                values.append(farm_id)
-            if farm_public_key is not None:
-                fields_to_update.append("farm_public_key = ?")
-                values.append(farm_public_key)
-            if farm_genesis_hash is not None:
-                fields_to_update.append("farm_genesis_hash = ?")
-                values.append(farm_genesis_hash)
-            if farm_size is not None:
-                fields_to_update.append("farm_size = ?")
-                values.append(farm_size)
-            if farm_directory is not None:
-                fields_to_update.append("farm_directory = ?")
-                values.append(farm_directory)
-            if farm_fastest_mode is not None:
-                fields_to_update.append("farm_fastest_mode = ?")
-                values.append(farm_fastest_mode)
-            if farm_initial_plot_complete is not None:
-                fields_to_update.append("farm_initial_plot_complete = ?")
-                values.append(farm_initial_plot_complete)
-            if farm_plot_progress is not None:
-                fields_to_update.append("farm_plot_progress = ?")
-                values.append(farm_plot_progress)
-            if farm_latest_sector is not None:
-                fields_to_update.append("farm_latest_sector = ?")
-                values.append(farm_latest_sector)
-
-            if not fields_to_update:
-                return {"message": "Nothing to update", "status_code": 200}
-
-            query = f"""
-            UPDATE farms
-            SET {', '.join(fields_to_update)}
-            WHERE farmer_id = ? AND farm_index = ?
-            """
-            values.append(farmer_id)
-            values.append(farm_index)
+        if farm_public_key is not None and previous_farmer_id != farmer_id:
+            farmer_cache.invalidate(db)
 
-            db.execute(query, values)
+        if commit:
             db.commit()
 
+        if row is None:
+            return {"message": "Nothing to update", "status_code": 200}
+
+        if row['revision']:
             return {'message': 'Farm updated successfully', 'status_code': 200}
+
+        return {'message': 'Farm inserted successfully', 'status_code': 201}
         
 
     @staticmethod
-    def insert_incomplete_sector(data):
-        REQUIRED_FIELDS = [
-            'sector_index', 'public_key', 'complete', 'plotter_id', 'event_datetime'
-        ]
-
-        # Check for missing fields
-        missing_fields = [field for field in REQUIRED_FIELDS if field not in data or data[field] is None]
-        if missing_fields:
-            return {
-                "message": f"Missing fields: {', '.join(missing_fields)}",
-                'status_code': 400
-            }
-        
-        sector_index = data.get('sector_index')
-        public_key = data.get('public_key')
-        complete = data.get('complete')
-        plotter_id = data.get('plotter_id')
-        event_datetime = data.get('event_datetime')
+    def get_farmer_id(public_key):
+        return farmer_cache.lookup_farmer_id(get_db(), public_key)
 
+    @staticmethod
+    def update_open_sector(public_key, sector_index, assignments, values):
         db = get_db()
+        tracker = get_sector_tracker()
+
+        # Update the tracked open sector by primary key. The extra conditions catch
+        # entries that went stale through a rollback or another worker's write.
+        sector_id = tracker.get(public_key, sector_index)
+        if sector_id is not None:
+            sector = db.execute(
+                f"""
+                UPDATE sectors
+                SET {assignments}
+                WHERE sector_id = ?
+                AND public_key = ?
+                AND sector_index = ?
+                AND complete = 0
+                RETURNING *
+                """,
+                values + [sector_id, public_key, sector_index], name='sector_open_update'
+            ).fetchone()
+
+            if sector:
+                return sector
+
+            tracker.discard(public_key, sector_index)
 
-        exists = db.execute(
+        # Fall back to the index for sectors opened by another worker or before a restart
+        sector = db.execute(
             """
-            SELECT COUNT(*) FROM sectors
-            WHERE sector_index = ? 
-            AND public_key = ? 
+            SELECT sector_id, strftime('%s', created_at) AS created FROM sectors
+            WHERE public_key = ? 
+            AND sector_index = ? 
             AND complete = 0
             AND created_at >= DATETIME('now', '-1 hour')
+            ORDER BY sector_id DESC
+            LIMIT 1
             """,
-            (sector_index, public_key)
-        ).fetchone()[0] > 0
-
-        farm = db.execute(
-            """
-            SELECT * FROM farms WHERE farm_public_key = ?
-            """, (public_key,)
+            (public_key, sector_index), name='sector_open_lookup'
         ).fetchone()
 
-        farmer_id = "Unknown"
-        
-        if farm:
-            farmer_id = farm['farmer_id']
-
-        if not exists:
-            query = """
-            INSERT INTO sectors (
-                sector_index, public_key, complete, farmer_id, plotter_id, started_at
-            ) VALUES (?, ?, ?, ?, ?, ?)
-            """
+        if not sector:
+            return None
 
-            values = [
-                sector_index,
-                public_key,
-                complete,
-                farmer_id,
-                plotter_id,
-                event_datetime
-            ]
+        tracker.add(public_key, sector_index, sector['sector_id'], int(sector['created']))
 
-            db.execute(query, values)
-            db.commit()
-            return {'message': 'Sector inserted successfully', 'status_code': 201}
-        
-        else:
-            query = """
+        return db.execute(
+            f"""
             UPDATE sectors
-            SET started_at = ?, plotter_id = ?
-            WHERE sector_index = ?
-            AND public_key = ?
-            AND complete = ?
-            AND created_at >= DATETIME('now', '-1 hour')
+            SET {assignments}
+            WHERE sector_id = ?
+            RETURNING *
+            """,
+            values + [sector['sector_id']], name='sector_open_update'
+        ).fetchone()
+
+    @staticmethod
+    def update_sector_rollups(plotter_id, farmer_id, complete, finished_at, plot_time_seconds):
+        try:
+            complete = int(complete)
+        except (TypeError, ValueError):
+            return
+
+        sectors = 1 if complete == 1 else 0
+        errored = 1 if complete == 2 else 0
+        if not sectors and not errored:
+            return
+
+        timed = 1 if sectors and plot_time_seconds is not None else 0
+        plot_time = plot_time_seconds if timed else None
+
+        rows = [
+            (bucket_size, bucket_format, finished_at, dimension, dimension_value,
+             sectors, errored, timed, plot_time or 0, plot_time, plot_time, bucket_format, finished_at)
+            for bucket_size, bucket_format in ROLLUP_BUCKETS.items()
+            for dimension, dimension_value in [('plotter', plotter_id), ('farmer', farmer_id)]
+            if dimension_value is not None
+        ]
+
+        # Skips rows whose finish time SQLite can't parse rather than failing the sector
+        get_db().executemany(
             """
+            INSERT INTO sector_rollups (
+                bucket_size, bucket_start, dimension, dimension_value, sectors, errored,
+                timed_sectors, plot_time_total, plot_time_min, plot_time_max
+            )
+            SELECT ?, strftime(?, ?), ?, ?, ?, ?, ?, ?, ?, ?
+            WHERE strftime(?, ?) IS NOT NULL
+            ON CONFLICT (bucket_size, dimension, dimension_value, bucket_start) DO UPDATE
+            SET sectors = sectors + excluded.sectors,
+                errored = errored + excluded.errored,
+                timed_sectors = timed_sectors + excluded.timed_sectors,
+                plot_time_total = plot_time_total + excluded.plot_time_total,
+                plot_time_min = MIN(COALESCE(plot_time_min, excluded.plot_time_min), COALESCE(excluded.plot_time_min, plot_time_min)),
+                plot_time_max = MAX(COALESCE(plot_time_max, excluded.plot_time_max), COALESCE(excluded.plot_time_max, plot_time_max))
+            """,
+            rows, name='sector_rollup_upsert'
+        )
 
-            values = [
-                event_datetime,
-                plotter_id,
-                sector_index,
-                public_key,
-                complete
-            ]
+    @staticmethod
+    def refresh_overview(condition, value):
+        get_db().execute(OVERVIEW_REFRESH.format(condition=condition), (value,), name='fleet_overview_refresh')
 
-            db.execute(query, values)
-            db.commit()
+    @staticmethod
+    def get_overview(hours):
+        if not 1 <= hours <= OVERVIEW_MAX_HOURS:
+            return {
+                "message": f"Hours must be between 1 and {OVERVIEW_MAX_HOURS}",
+                'status_code': 400
+            }
 
-            return {'message': 'Sector updated successfully', 'status_code': 200}
-        
+        db = get_db()
+        rows = db.execute("SELECT * FROM fleet_overview ORDER BY farmer_id", name='fleet_overview').fetchall()
+
+        # Throughput slides with the clock, so it is summed from the hourly rollups on
+        # read: the current hour and the hours - 1 before it
+        throughput = {
+            row['farmer_id']: row for row in db.execute(
+                """
+                SELECT
+                    dimension_value AS farmer_id, SUM(sectors) AS sectors, SUM(errored) AS errored,
+                    CAST(SUM(plot_time_total) AS REAL) / NULLIF(SUM(timed_sectors), 0) AS plot_time_avg
+                FROM sector_rollups
+                WHERE bucket_size = 'hour' AND dimension = 'farmer'
+                AND bucket_start >= strftime(?, 'now', ?)
+                GROUP BY dimension_value
+                """,
+                (ROLLUP_BUCKETS['hour'], f'-{hours - 1} hours'),
+                name='fleet_overview_throughput'
+            ).fetchall()
+        }
+
+        data = []
+        for row in rows:
+            farmer = dict(row)
+            farmer['farms'] = json.loads(farmer['farms'])
+
+            recent = throughput.get(row['farmer_id'])
+            sectors = recent['sectors'] if recent else 0
+            farmer['throughput'] = {
+                'sectors': sectors,
+                'errored': recent['errored'] if recent else 0,
+                'sectors_per_hour': round(sectors / hours, 2),
+                'plot_time_avg': recent['plot_time_avg'] if recent else None
+            }
+            data.append(farmer)
+
+        return {
+            'data': data,
+            'hours': hours,
+            'total_rows': len(data)
+        }
 
     @staticmethod
-    def update_complete_sector(data):
-        REQUIRED_FIELDS = [
-            'sector_index', 'public_key', 'complete', 'plotter_id', 'event_datetime'
-        ]
+    def get_sector_stats(bucket_size, dimension, dimension_value, start, end, limit):
+        if bucket_size not in ROLLUP_BUCKETS:
+            return {
+                "message": f"Invalid bucket: {bucket_size}",
+                'status_code': 400
+            }
 
-        # Check for missing fields
-        missing_fields = [field for field in REQUIRED_FIELDS if field not in data or data[field] is None]
-        if missing_fields:
+        if dimension not in ['plotter', 'farmer']:
             return {
-                "message": f"Missing fields: {', '.join(missing_fields)}",
+                "message": f"Invalid dimension: {dimension}",
+                'status_code': 400
+            }
+
+        if limit <= 0:
+            return {
+                "message": "Limit must be a positive integer",
                 'status_code': 400
             }
+
+        filter_clauses = ["bucket_size = ?", "dimension = ?"]
+        filter_values = [bucket_size, dimension]
+
+        if dimension_value:
+            filter_clauses.append("dimension_value = ?")
+            filter_values.append(dimension_value)
+        if start:
+            filter_clauses.append("bucket_start >= ?")
+            filter_values.append(start)
+        if end:
+            filter_clauses.append("bucket_start <= ?")
+            filter_values.append(end)
+
+        rows = get_db().execute(
+            f"""
+            SELECT
+                bucket_start, dimension_value, sectors, errored, timed_sectors,
+                plot_time_total, plot_time_min, plot_time_max,
+                CAST(plot_time_total AS REAL) / NULLIF(timed_sectors, 0) AS plot_time_avg
+            FROM sector_rollups
+            WHERE {' AND '.join(filter_clauses)}
+            ORDER BY bucket_start DESC, dimension_value
+            LIMIT ?
+            """,
+            filter_values + [limit], name='sector_stats'
+        ).fetchall()
+
+        return {
+            'data': [dict(row) for row in rows],
+            'bucket': bucket_size,
+            'dimension': dimension,
+            'limit': limit
+        }
+
+    @staticmethod
+    def insert_incomplete_sector(data, commit=True):
+        error = APIDB.validate('incomplete_sector', data)
+        if error:
+            return error
         
         sector_index = data.get('sector_index')
         public_key = data.get('public_key')
@@ -485,78 +1045,135 @@ class APIDB:
         event_datetime = data.get('event_datetime')
 
         db = get_db()
+        db.begin('sectors')
+
+        # Restart the open sector if this plot was already requested
+        sector = APIDB.update_open_sector(
+            public_key,
+            sector_index,
+            "started_at = ?, plotter_id = ?, updated_at = CURRENT_TIMESTAMP",
+            [event_datetime, plotter_id]
+        )
 
-        farm = db.execute(
-            """
-            SELECT * FROM farms WHERE farm_public_key = ?
-            """, (public_key,)
-        ).fetchone()
+        if sector is not None:
+            db.touch('sectors')
 
-        farmer_id = "Unknown"
-        
-        if farm:
-            farmer_id = farm['farmer_id']
+            if commit:
+                db.commit()
 
-        sector = db.execute(
-            """
-            SELECT * FROM sectors
-            WHERE sector_index = ? 
-            AND public_key = ? 
-            AND complete = 0
-            AND created_at >= DATETIME('now', '-1 hour')
-            """,
-            (sector_index, public_key)
-        ).fetchone()
+            return {'message': 'Sector updated successfully', 'status_code': 200}
 
-        if not sector:
-            query = """
-            INSERT INTO sectors (
-                sector_index, public_key, complete, farmer_id, plotter_id, finished_at
-            ) VALUES (?, ?, ?, ?, ?, ?)
-            """
+        farmer_id = APIDB.get_farmer_id(public_key)
+
+        query = """
+        INSERT INTO sectors (
+            sector_index, public_key, complete, farmer_id, plotter_id, started_at
+        ) VALUES (?, ?, ?, ?, ?, ?)
+        """
+
+        values = [
+            sector_index,
+            public_key,
+            complete,
+            farmer_id,
+            plotter_id,
+            event_datetime
+        ]
 
-            values = [
-                sector_index,
-                public_key,
-                complete,
-                farmer_id,
-                plotter_id,
-                event_datetime
-            ]
+        cursor = db.execute(query, values, name='sector_insert')
+        db.touch('sectors')
 
-            db.execute(query, values)
+        if commit:
             db.commit()
-            return {'message': 'Sector inserted successfully', 'status_code': 201}
+
+        get_sector_tracker().add(public_key, sector_index, cursor.lastrowid)
+
+        return {'message': 'Sector inserted successfully', 'status_code': 201}
         
-        else:
-            started_at = sector['started_at']
-            logger.info(started_at)
 
-            query = """
-            UPDATE sectors
-            SET 
+    @staticmethod
+    def update_complete_sector(data, commit=True):
+        error = APIDB.validate('complete_sector', data)
+        if error:
+            return error
+        
+        sector_index = data.get('sector_index')
+        public_key = data.get('public_key')
+        complete = data.get('complete')
+        plotter_id = data.get('plotter_id')
+        event_datetime = data.get('event_datetime')
+
+        db = get_db()
+        db.begin('sectors')
+
+        # Close the open sector, timing it from its own started_at
+        sector = APIDB.update_open_sector(
+            public_key,
+            sector_index,
+            """
                 finished_at = ?, 
                 plotter_id = ?, 
                 complete = ?, 
-                plot_time_seconds = (strftime('%s', ?) - strftime('%s', ?))
-            WHERE 
-                sector_index = ?
-                AND public_key = ?
-                AND complete = 0
-                AND created_at >= DATETIME('now', '-1 hour')
-            """
+                plot_time_seconds = (strftime('%s', ?) - strftime('%s', started_at)),
+                updated_at = CURRENT_TIMESTAMP
+            """,
+            [event_datetime, plotter_id, complete, event_datetime]
+        )
+
+        if sector is not None:
+            db.touch('sectors')
+            APIDB.update_sector_rollups(sector['plotter_id'], sector['farmer_id'], complete, event_datetime, sector['plot_time_seconds'])
+
+            if commit:
+                db.commit()
+
+            get_sector_tracker().discard(public_key, sector_index)
+
+            return {'message': 'Sector updated successfully', 'status_code': 200}
+
+        farmer_id = APIDB.get_farmer_id(public_key)
+
+        query = """
+        INSERT INTO sectors (
+            sector_index, public_key, complete, farmer_id, plotter_id, finished_at
+        ) VALUES (?, ?, ?, ?, ?, ?)
+        """
+
+        values = [
+            sector_index,
+            public_key,
+            complete,
+            farmer_id,
+            plotter_id,
+            event_datetime
+        ]
+
+        db.execute(query, values, name='sector_insert')
+        db.touch('sectors')
+
+        # Never saw the start of this plot, so it counts towards throughput but not plot time
+        APIDB.update_sector_rollups(plotter_id, farmer_id, complete, event_datetime, None)
 
-            values = [
-                event_datetime,
-                plotter_id,
-                complete,
-                event_datetime,
-                started_at,
-                sector_index,
-                public_key,
-            ]
-
-            db.execute(query, values)
+        if commit:
             db.commit()
 
-            return {'message': 'Sector updated successfully', 'status_code': 200}
\ No newline at end of file
+        return {'message': 'Sector inserted successfully', 'status_code': 201}
+
+INSERT_METHODS = {
+    'event': APIDB.insert_event,
+    'container': APIDB.insert_container,
+    'farmer': APIDB.insert_farmer,
+    'farm': APIDB.insert_farm,
+    'incomplete_sector': APIDB.insert_incomplete_sector,
+    'complete_sector': APIDB.update_complete_sector
+}
+
+# Table each insert method writes, so a transaction only locks the database holding it
+INSERT_TABLES = {
+    'event': 'events',
+    'container': 'containers',
+    'farmer': 'farmers',
+    'farm': 'farms',
+    'incomplete_sector': 'sectors',
+    'complete_sector': 'sectors'
+}
@@ -1,10 +1,21 @@
 from flask import (
-    Blueprint, jsonify, request, abort
+    Blueprint, jsonify, request, abort, current_app, Response, stream_with_context
 )
 from .db import get_db
-from .api_db import APIDB
+from .api_db import APIDB, INSERT_METHODS
+from .ingest_queue import get_ingest_queue
+from .catalog import get_catalog
+from .response_cache import get_response_cache
+from . import metrics
+from .retention import get_retention_job, retention_stats
+from .event_stream import STREAM_BATCH_SIZE, get_event_broadcaster
 from .logger import logger
 import traceback
+import json
+import hashlib
+import csv
+import io
+import zlib
 
 api_routes = Blueprint('api_routes', __name__)
 
@@ -12,24 +23,52 @@ api_routes = Blueprint('api_routes', __name__)
 def ping():
     return jsonify({"message": "pong"}), 200
 
+@api_routes.route('/metrics', methods=['GET'])
+def get_metrics():
+    return current_app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@api_routes.route('/admin/slow-queries', methods=['GET'])
+def get_slow_queries():
+    return jsonify({
+        'threshold': current_app.config['SLOW_QUERY_THRESHOLD'],
+        'data': metrics.slow_queries()
+    }), 200
+
+@api_routes.route('/admin/retention', methods=['GET'])
+def get_retention():
+    job = get_retention_job()
+    return jsonify({
+        'policy': current_app.config['EVENT_RETENTION'],
+        'interval': current_app.config['EVENT_RETENTION_INTERVAL'],
+        'last_run': job.last_run if job else None,
+        **retention_stats()
+    }), 200
+
+def queue_full():
+    response = jsonify({"error": "Ingest queue is full"})
+    response.headers['Retry-After'] = str(current_app.config['INGEST_RETRY_AFTER'])
+    return response, 503
+
 @api_routes.route('/insert/<entity>', methods=['POST'])
 def insert(entity):
     data = request.json
 
-    insert_methods = {
-        'event': APIDB.insert_event,
-        'container': APIDB.insert_container,
-        'farmer': APIDB.insert_farmer,
-        'farm': APIDB.insert_farm,
-        'incomplete_sector': APIDB.insert_incomplete_sector,
-        'complete_sector': APIDB.update_complete_sector
-    }
-
     # Retrieve the appropriate insertion method based on the entity
-    execute = insert_methods.get(entity)
+    execute = INSERT_METHODS.get(entity)
 
     if not execute:
         return jsonify({"error": f"Unknown entity: {entity}"}), 400
+
+    # Write-behind mode: validate now, let the ingest writer commit it later
+    if current_app.config['INGEST_ASYNC']:
+        error = APIDB.validate(entity, data)
+        if error:
+            return jsonify({"message": error['message']}), error['status_code']
+
+        if not get_ingest_queue().offer([(entity, data)]):
+            return queue_full()
+
+        return jsonify({"message": "Accepted"}), 202
     
     try:
         response = execute(data)
@@ -39,6 +78,62 @@ def insert(entity):
         logger.error(f'Error in insert route: {e}')
         return jsonify(f"Internal Server Error: {str(e)}"), 500
 
+@api_routes.route('/insert/<entity>/batch', methods=['POST'])
+def insert_batch(entity):
+    if entity not in INSERT_METHODS:
+        return jsonify({"error": f"Unknown entity: {entity}"}), 400
+
+    # Accept either a JSON array or newline-delimited JSON objects
+    if request.mimetype == 'application/x-ndjson':
+        records = []
+        for line_number, line in enumerate(request.get_data(as_text=True).splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                return jsonify({"error": f"Invalid JSON on line {line_number}"}), 400
+    else:
+        records = request.get_json(silent=True)
+        if not isinstance(records, list):
+            return jsonify({"error": "Batch body must be a JSON array"}), 400
+
+    max_records = current_app.config['BATCH_MAX_RECORDS']
+    if len(records) > max_records:
+        return jsonify({"error": f"Batch exceeds {max_records} records"}), 413
+
+    if current_app.config['INGEST_ASYNC']:
+        results = [APIDB.validate(entity, record) or {"message": "Accepted", 'status_code': 202} for record in records]
+        accepted = [(entity, record) for record, result in zip(records, results) if result['status_code'] == 202]
+
+        if not get_ingest_queue().offer(accepted):
+            return queue_full()
+
+        return jsonify({"results": [{'index': index, **result} for index, result in enumerate(results)]}), 202
+
+    try:
+        results = APIDB.insert_batch(entity, records)
+        return jsonify({"results": results}), 200
+
+    except Exception as e:
+        logger.error(f'Error in insert batch route: {e}')
+        return jsonify(f"Internal Server Error: {str(e)}"), 500
+
+@api_routes.route('/get/overview', methods=['GET'])
+def get_overview():
+    hours = request.args.get('hours', current_app.config['OVERVIEW_THROUGHPUT_HOURS'], type=int)
+
+    try:
+        response = APIDB.get_overview(hours)
+        if 'status_code' in response:
+            return jsonify({"message": response['message']}), response['status_code']
+
+        return jsonify(response), 200
+
+    except Exception as e:
+        logger.error(f'Error in overview route: {e}')
+        return jsonify(f"Internal Server Error: {str(e)}"), 500
+
 @api_routes.route('/get/<entity>', methods=['GET'])
 def get_entity(entity):
     page = request.args.get('page', 1, type=int)
@@ -47,12 +142,195 @@ def get_entity(entity):
     end = request.args.get('end')
     sort_order = request.args.get('sort_order', 'DESC')
     sort_column = request.args.get('sort_column')
-    filters = {key: value for key, value in request.args.items() if key not in ['page', 'limit', 'start', 'end', 'sort_order', 'sort_column']}
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total', type=lambda value: value.lower() in ['1', 'true', 'yes'])
+    time_column = request.args.get('time_column')
+    filters = {key: value for key, value in request.args.items() if key not in ['page', 'limit', 'start', 'end', 'time_column', 'sort_order', 'sort_column', 'cursor', 'include_total']}
     
     try:
-        response = APIDB.get_entity(entity, page, limit, filters, start, end, sort_column, sort_order)
-        return jsonify(response), 200
+        # Every write to the table bumps its generation, so the generation plus the
+        # query identifies the response without running the query
+        generation = APIDB.get_generation(entity)
+        columns = get_catalog().columns(entity)
+        if generation is None or columns is None:
+            response = APIDB.get_entity(entity, page, limit, filters, start, end, sort_column, sort_order, cursor, include_total, time_column)
+            return jsonify(response), response.get('status_code', 200)
+
+        query = tuple(sorted(request.args.items(multi=True)))
+        # A migration, or a change to EVENT_DATA_INDEXES, can change a response's columns
+        # without touching the table's rows
+        key = (get_catalog().version, tuple(columns.items()), entity, query)
+        etag = hashlib.sha1(repr((key, generation)).encode('utf8')).hexdigest()
+
+        if request.if_none_match.contains(etag):
+            not_modified = current_app.response_class(status=304)
+            not_modified.set_etag(etag)
+            return not_modified
+
+        cache = get_response_cache()
+        response = cache.get(key, generation)
+        if response is None:
+            response = APIDB.get_entity(entity, page, limit, filters, start, end, sort_column, sort_order, cursor, include_total, time_column)
+
+            # Validation errors are cheap to recompute and carry no ETag
+            if 'status_code' in response:
+                return jsonify(response), response['status_code']
+
+            cache.put(key, generation, response)
+
+        result = jsonify(response)
+        result.set_etag(etag)
+        return result, 200
     
     except Exception as e:
         logger.error(f'Error in get entity route: {e}')
-        return jsonify(f"Internal Server Error: {str(e)}"), 500
\ No newline at end of file
+        return jsonify(f"Internal Server Error: {str(e)}"), 500
+
+@api_routes.route('/stats/sectors', methods=['GET'])
+def sector_stats():
+    bucket = request.args.get('bucket', 'hour')
+    dimension = request.args.get('dimension', 'plotter')
+    value = request.args.get('value')
+    start = request.args.get('start')
+    end = request.args.get('end')
+    limit = request.args.get('limit', 1000, type=int)
+
+    try:
+        response = APIDB.get_sector_stats(bucket, dimension, value, start, end, limit)
+        if 'status_code' in response:
+            return jsonify({"message": response['message']}), response['status_code']
+
+        return jsonify(response), 200
+
+    except Exception as e:
+        logger.error(f'Error in sector stats route: {e}')
+        return jsonify(f"Internal Server Error: {str(e)}"), 500
+
+@api_routes.route('/export/<entity>', methods=['GET'])
+def export_entity(entity):
+    export_format = request.args.get('format', 'ndjson')
+    start = request.args.get('start')
+    end = request.args.get('end')
+    compress = request.args.get('gzip', 'false').lower() in ['1', 'true', 'yes']
+    time_column = request.args.get('time_column')
+    filters = {key: value for key, value in request.args.items() if key not in ['format', 'start', 'end', 'time_column', 'gzip']}
+
+    if export_format not in ['ndjson', 'csv']:
+        return jsonify({"error": f"Invalid format: {export_format}"}), 400
+
+    try:
+        response = APIDB.export_entity(entity, filters, start, end, time_column)
+        if response['status_code'] != 200:
+            return jsonify({"message": response['message']}), response['status_code']
+
+    except Exception as e:
+        logger.error(f'Error in export route: {e}')
+        return jsonify(f"Internal Server Error: {str(e)}"), 500
+
+    columns = response['columns']
+
+    def generate():
+        buffer = io.StringIO()
+
+        if export_format == 'csv':
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+
+        for chunk in response['rows']:
+            for row in chunk:
+                if export_format == 'csv':
+                    writer.writerow(row)
+                else:
+                    buffer.write(current_app.json.dumps(dict(row)))
+                    buffer.write('\n')
+
+            yield buffer.getvalue().encode('utf8')
+            buffer.seek(0)
+            buffer.truncate()
+
+        # Headers only for an empty CSV export
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf8')
+
+    def generate_gzip():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for data in generate():
+            compressed = compressor.compress(data)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    body = generate_gzip() if compress else generate()
+    headers = {'Content-Disposition': f'attachment; filename={entity}.{export_format}'}
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+
+@api_routes.route('/stream/events', methods=['GET'])
+def stream_events():
+    start = request.args.get('start')
+    end = request.args.get('end')
+    time_column = request.args.get('time_column')
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    filters = {key: value for key, value in request.args.items() if key not in ['start', 'end', 'time_column', 'last_event_id']}
+
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return jsonify({"message": f"Invalid Last-Event-ID: {last_event_id}"}), 400
+
+    error, filter_spec, filter_values = APIDB.build_filters('events', get_catalog().columns('events'), filters, start, end, time_column)
+    if error:
+        return jsonify({"message": error['message']}), error['status_code']
+
+    # A sync worker serves one request at a time, so a stream would block every other
+    # request until the worker timeout killed it
+    if not request.environ.get('wsgi.multithread'):
+        return jsonify({"message": "Streaming needs a threaded or async worker"}), 503
+
+    broadcaster = get_event_broadcaster()
+    subscription = broadcaster.subscribe(filter_spec, filter_values)
+    if subscription is None:
+        response = jsonify({"message": "Too many stream clients, try again later"})
+        response.headers['Retry-After'] = str(current_app.config['INGEST_RETRY_AFTER'])
+        return response, 503
+
+    heartbeat = current_app.config['STREAM_HEARTBEAT']
+
+    def message(row):
+        metrics.registry.inc('spaceport_stream_events_sent_total')
+        return f"id: {row['event_id']}\nevent: event\ndata: {current_app.json.dumps(dict(row))}\n\n"
+
+    def generate():
+        try:
+            # Catch up from the database on what the client missed, then switch to live rows
+            if last_event_id is not None:
+                after = last_event_id
+                while True:
+                    rows = APIDB.event_backlog(filter_spec, filter_values, after, subscription.position, STREAM_BATCH_SIZE)
+                    for row in rows:
+                        yield message(row)
+
+                    if len(rows) < STREAM_BATCH_SIZE:
+                        break
+                    after = rows[-1]['event_id']
+
+            while True:
+                rows = subscription.take(heartbeat)
+                for row in rows:
+                    yield message(row)
+
+                if subscription.overflowed:
+                    yield "event: overflow\ndata: {}\n\n"
+                    return
+
+                if not rows:
+                    yield ": keepalive\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
@@ -0,0 +1,321 @@
+import gzip
+import json
+import mmap
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from . import event_data, metrics
+from .catalog import get_catalog
+from .db import get_db
+from .jobs import PeriodicJob
+from .logger import logger
+
+SEGMENT_SUFFIX = '.ndjson.gz'
+INDEX_SUFFIX = '.index.json'
+
+# Rows read from SQLite per step while writing a segment
+ARCHIVE_FETCH_SIZE = 500
+
+# Events deleted per transaction once their segment is on disk
+ARCHIVE_DELETE_BATCH_SIZE = 1000
+
+# Segments whose dedup keys are kept in memory for checking replayed events
+ARCHIVE_KEY_CACHE_SIZE = 8
+
+
+class EventArchive:
+    """
+    Immutable, day-partitioned gzip NDJSON segments of events moved out of SQLite.
+    Each segment has a sidecar index with its time range, event_id range and
+    container ids, so readers only open the segments a query can match.
+    """
+
+    def __init__(self, directory, max_segments, max_rows):
+        self.directory = directory
+        self.max_segments = max_segments
+        self.max_rows = max_rows
+        self.index = []
+        self.days = {}
+        self.index_mtime = None
+        self.keys = OrderedDict()
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def segments(self):
+        # Sidecars are small; only reread them when a segment was added
+        mtime = os.stat(self.directory).st_mtime_ns
+
+        with self.lock:
+            if mtime != self.index_mtime:
+                index = []
+                for name in os.listdir(self.directory):
+                    if name.endswith(INDEX_SUFFIX):
+                        with open(os.path.join(self.directory, name)) as f:
+                            index.append(json.load(f))
+
+                self.index = sorted(index, key=lambda segment: segment['first_event_id'])
+                self.days = {}
+                for segment in self.index:
+                    self.days.setdefault(segment['day'], []).append(segment)
+                self.index_mtime = mtime
+
+            return self.index
+
+    def segments_for_day(self, day):
+        self.segments()
+        with self.lock:
+            return list(self.days.get(day, []))
+
+    def contains(self, event_container_id, event_datetime, event_data_hash):
+        # The unique index on events only sees hot rows, so a replayed event of an archived
+        # day is checked against that day's segments on the same key
+        key = (event_container_id, event_datetime, event_data_hash)
+        for segment in self.segments_for_day(event_datetime[:10]):
+            if event_container_id in segment['containers'] and key in self.segment_keys(segment):
+                return True
+
+        return False
+
+    def segment_keys(self, segment):
+        with self.lock:
+            keys = self.keys.get(segment['file'])
+            if keys is not None:
+                self.keys.move_to_end(segment['file'])
+                return keys
+
+        keys = {
+            (record['event_container_id'], str(record['event_datetime']), record.get('event_data_hash'))
+            for record in self.read(segment)
+        }
+
+        with self.lock:
+            self.keys[segment['file']] = keys
+            while len(self.keys) > ARCHIVE_KEY_CACHE_SIZE:
+                self.keys.popitem(last=False)
+
+        return keys
+
+    def select(self, start, end, container_ids=None):
+        return [
+            segment for segment in self.segments()
+            if (start is None or segment['end'] >= start)
+            and (end is None or segment['start'] <= end)
+            and (container_ids is None or not container_ids.isdisjoint(segment['containers']))
+        ]
+
+    def window_error(self, segments):
+        # attach() loads every row of the segments into memory on the connection, so a
+        # window is refused before anything is decompressed when it would load too much
+        if len(segments) > self.max_segments:
+            return f"Time window spans {len(segments)} archived segments, the limit is {self.max_segments}"
+
+        rows = sum(segment['rows'] for segment in segments)
+        if rows > self.max_rows:
+            return f"Time window spans {rows} archived events, the limit is {self.max_rows}"
+
+        return None
+
+    def read(self, segment):
+        path = os.path.join(self.directory, segment['file'])
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with gzip.GzipFile(fileobj=mapped) as lines:
+                for line in lines:
+                    yield json.loads(line)
+
+        metrics.registry.inc('spaceport_archive_segments_read_total')
+
+    def write(self, db, day, next_day, first_event_id, last_event_id):
+        name = f'events-{day}-{first_event_id}-{last_event_id}'
+        index_path = os.path.join(self.directory, name + INDEX_SUFFIX)
+
+        # The sidecar is written last, so its presence means the segment is complete.
+        # A run that stopped before deleting the rows finds it and only deletes them.
+        if os.path.exists(index_path):
+            return
+
+        cursor = db.execute(
+            """
+            SELECT * FROM events
+            WHERE event_datetime >= ? AND event_datetime < ?
+            AND event_id BETWEEN ? AND ?
+            ORDER BY event_id
+            """,
+            (day, next_day, first_event_id, last_event_id),
+            name='event_archive_read'
+        )
+        columns = [description[0] for description in cursor.description]
+
+        rows = 0
+        start = end = None
+        containers = set()
+        segment_path = os.path.join(self.directory, name + SEGMENT_SUFFIX)
+
+        with open(segment_path + '.tmp', 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as out:
+                for chunk in iter(lambda: cursor.fetchmany(ARCHIVE_FETCH_SIZE), []):
+                    for row in chunk:
+                        record = dict(zip(columns, row))
+                        out.write(json.dumps(record, default=str).encode('utf8') + b'\n')
+
+                        event_datetime = str(record['event_datetime'])
+                        start = event_datetime if start is None else min(start, event_datetime)
+                        end = event_datetime if end is None else max(end, event_datetime)
+                        containers.add(record['event_container_id'])
+                        rows += 1
+
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(segment_path + '.tmp', segment_path)
+
+        index = {
+            'file': name + SEGMENT_SUFFIX,
+            'day': day,
+            'start': start,
+            'end': end,
+            'first_event_id': first_event_id,
+            'last_event_id': last_event_id,
+            'rows': rows,
+            'containers': sorted(containers),
+            'columns': columns,
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        }
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump(index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(index_path + '.tmp', index_path)
+
+    def attach(self, db, segments):
+        # Loads the segments into a temp table on this connection, where they can be
+        # queried together with the hot rows. Kept until a different set is needed.
+        catalog = get_catalog()
+        key = (catalog.version, tuple(segment['file'] for segment in segments))
+        if getattr(db, 'archive_attached', None) == key:
+            return
+
+        columns = catalog.columns('events')
+        db.execute("DROP TABLE IF EXISTS temp.archived_events")
+        db.execute(f"CREATE TEMP TABLE archived_events AS SELECT {', '.join(columns)} FROM events WHERE 0")
+
+        for segment in segments:
+            names = [column for column in segment['columns'] if column in columns]
+            db.executemany(
+                f"INSERT INTO temp.archived_events ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                ([record.get(column) for column in names] for record in self.read(segment)),
+                name='event_archive_attach'
+            )
+
+        # Segments written before a generated column was declared don't carry its values
+        for column, path in event_data.generated_columns(current_app.config['EVENT_DATA_INDEXES']).items():
+            if column in columns:
+                db.execute(f"UPDATE temp.archived_events SET {column} = json_extract(event_data, '{path}')")
+
+        # Temp tables never take the database write lock, but the insert opened a transaction
+        db.commit()
+        db.archive_attached = key
+
+
+def archive_source(columns):
+    # event_id is the rowid of events, so cursors work the same over archived rows
+    column_list = ', '.join(columns)
+    return (
+        f"(SELECT event_id AS rowid, {column_list} FROM events "
+        f"UNION ALL SELECT event_id AS rowid, {column_list} FROM temp.archived_events) AS events"
+    )
+
+
+def get_event_archive():
+    return current_app.extensions.get('event_archive')
+
+
+def window_segments(entity, filter_spec, filter_values, start, end, time_column=None):
+    # Archived rows are only read for an event_datetime window with a lower bound that reaches
+    # them. An end alone would match every segment before it, so it only sees hot rows.
+    archive = get_event_archive()
+    if archive is None or entity != 'events' or time_column not in (None, 'event_datetime') or not start:
+        return archive, []
+
+    # Container filters rule out segments by their sidecar index
+    container_ids = None
+    offset = 0
+    for column, operator, arity in filter_spec:
+        if column == 'event_container_id' and operator in ('=', 'IN'):
+            values = set(filter_values[offset:offset + arity])
+            container_ids = values if container_ids is None else container_ids & values
+        offset += arity
+
+    return archive, archive.select(start, end, container_ids)
+
+
+class ArchiveJob(PeriodicJob):
+    name = 'event-archive'
+
+    def __init__(self, app, archive):
+        super().__init__(app, app.config['EVENT_ARCHIVE_INTERVAL'])
+        self.archive = archive
+        self.after_days = app.config['EVENT_ARCHIVE_AFTER_DAYS']
+
+    def delete(self, db, day, next_day, first_event_id, last_event_id):
+        # A run stopped partway through is finished by the next one, see run_once
+        return self.delete_in_batches(
+            db, 'events', 'event_datetime >= ? AND event_datetime < ? AND event_id BETWEEN ? AND ?',
+            (day, next_day, first_event_id, last_event_id), ARCHIVE_DELETE_BATCH_SIZE, 'event_archive_delete'
+        )
+
+    def run_once(self):
+        db = get_db()
+        started = time.perf_counter()
+        cutoff = db.execute("SELECT DATE('now', ?)", (f'-{self.after_days} days',)).fetchone()[0]
+        archived = {}
+
+        # Oldest day first
+        while not self.stopping.is_set():
+            oldest = db.execute("SELECT MIN(event_datetime) FROM events", name='event_archive_oldest').fetchone()[0]
+            if oldest is None or str(oldest) >= cutoff:
+                break
+
+            day = str(oldest)[:10]
+            next_day = db.execute("SELECT DATE(?, '+1 day')", (day,)).fetchone()[0]
+            archived[day] = 0
+
+            # A run that stopped partway through the delete left rows that a segment of this
+            # day already holds. event_ids only grow, so every row of the day inside a
+            # segment's range was written to it; those are only deleted, never written again.
+            for segment in self.archive.segments_for_day(day):
+                archived[day] += self.delete(db, day, next_day, segment['first_event_id'], segment['last_event_id'])
+
+            # Rows a stopped delete left behind are still in a segment and must not be written again
+            if self.stopping.is_set():
+                break
+
+            first_event_id, last_event_id = db.execute(
+                """
+                SELECT MIN(event_id), MAX(event_id) FROM events
+                WHERE event_datetime >= ? AND event_datetime < ?
+                """,
+                (day, next_day),
+                name='event_archive_range'
+            ).fetchone()
+
+            if first_event_id is not None:
+                self.archive.write(db, day, next_day, first_event_id, last_event_id)
+                archived[day] += self.delete(db, day, next_day, first_event_id, last_event_id)
+            metrics.registry.inc('spaceport_events_archived_total', (), archived[day])
+
+        elapsed = time.perf_counter() - started
+        if archived:
+            logger.info(f'Archived {sum(archived.values())} events from {len(archived)} days in {elapsed:.2f}s')
+
+
+def init_app(app):
+    if not app.config['EVENT_ARCHIVE_DIR']:
+        return
+
+    archive = app.extensions['event_archive'] = EventArchive(
+        app.config['EVENT_ARCHIVE_DIR'], app.config['EVENT_ARCHIVE_MAX_SEGMENTS'], app.config['EVENT_ARCHIVE_MAX_ROWS']
+    )
+
+    job = app.extensions['event_archive_job'] = ArchiveJob(app, archive)
+    job.install()
@@ -0,0 +1,73 @@
+import threading
+from functools import lru_cache, partial
+from flask import current_app
+from .logger import logger
+
+# Tables exposed through /get/<entity> and /export/<entity>
+ENTITIES = ['events', 'containers', 'farmers', 'farms', 'sectors']
+
+
+class SchemaCatalog:
+    def __init__(self):
+        self.tables = {}
+        self.not_null = {}
+        self.version = None
+        self.compile_query = None
+        self.lock = threading.Lock()
+
+    def load(self, db):
+        version = db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+        # table_xinfo includes generated columns; hidden = 1 only marks virtual table internals
+        tables = {
+            entity: {
+                row['name']: (row['type'] or '').upper()
+                for row in db.execute(f"PRAGMA table_xinfo({entity})").fetchall()
+                if row['hidden'] != 1
+            }
+            for entity in ENTITIES
+        }
+
+        # Columns that can never hold NULL, including an INTEGER PRIMARY KEY (the rowid)
+        not_null = {
+            entity: {
+                row['name'] for row in db.execute(f"PRAGMA table_xinfo({entity})").fetchall()
+                if row['notnull'] or (row['pk'] and (row['type'] or '').upper() == 'INTEGER')
+            }
+            for entity in ENTITIES
+        }
+
+        # Compiled queries were validated against the old columns, so each load starts a
+        # new cache. Kept on the catalog, so apps in the same process never share one.
+        from .api_db import QUERY_CACHE_SIZE, compile_entity_query
+        compile_query = lru_cache(maxsize=QUERY_CACHE_SIZE)(partial(compile_entity_query, self))
+
+        with self.lock:
+            self.tables = tables
+            self.not_null = not_null
+            self.version = version
+            self.compile_query = compile_query
+
+        logger.info(f'Loaded schema catalog at version {version}')
+
+    def columns(self, entity):
+        return self.tables.get(entity)
+
+    def nullable(self, entity, column):
+        return column not in self.not_null.get(entity, ())
+
+
+def get_catalog():
+    return current_app.extensions['schema_catalog']
+
+
+def init_app(app):
+    from .db import get_db
+
+    # Migrations only run while a worker starts, before this, so a serving worker's
+    # catalog never goes out of date. A new schema version needs a restart to be served.
+    catalog = SchemaCatalog()
+    app.extensions['schema_catalog'] = catalog
+
+    with app.app_context():
+        catalog.load(get_db())
@@ -1,15 +1,244 @@
+import fcntl
+import hashlib
+import os
+import re
 import sqlite3
+import threading
+import time
 # import click
+from contextlib import contextmanager
 from flask import current_app, g
+from . import metrics
+from .logger import logger
+
+MIGRATION_FILENAME = re.compile(r'^(\d+)_\w+\.sql$')
+
+# Persistent connections, one per database for each thread of each worker process
+_connections = threading.local()
+
+# Called with the set of tables written by each committed transaction
+commit_listeners = []
+
+# Schema name of the separate events database when EVENTS_DATABASE is set
+EVENTS_SCHEMA = 'events_db'
+
+# table_generations entry bumped whenever the statistics job runs ANALYZE
+STATISTICS_TABLE = 'sqlite_stat1'
+
+# Seconds between a persistent connection's checks for refreshed statistics
+STATISTICS_CHECK_INTERVAL = 30
+
+
+def sha256(value):
+    if value is None:
+        return None
+    return hashlib.sha256(value.encode('utf8')).hexdigest()
+
+
+class Connection(sqlite3.Connection):
+    slow_query_threshold = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dirty_tables = set()
+        # Tables kept in an attached database, by schema name; everything else is in main
+        self.table_schemas = {}
+        self.statistics_generation = None
+        self.statistics_checked = time.monotonic()
+
+    def schema(self, table):
+        return self.table_schemas.get(table, 'main')
+
+    def execute(self, sql, parameters=(), name='other'):
+        started = time.perf_counter()
+        cursor = super().execute(sql, parameters)
+        elapsed = time.perf_counter() - started
+        metrics.registry.observe('spaceport_db_query_duration_seconds', (('query', name),), elapsed)
+
+        if cursor.rowcount > 0:
+            metrics.registry.inc('spaceport_db_rows_total', (('query', name),), cursor.rowcount)
+
+        if self.slow_query_threshold is not None and elapsed >= self.slow_query_threshold:
+            self.record_slow_query(sql, parameters, name, elapsed)
+
+        return cursor
+
+    def executemany(self, sql, parameters, name='other'):
+        started = time.perf_counter()
+        cursor = super().executemany(sql, parameters)
+        elapsed = time.perf_counter() - started
+        metrics.registry.observe('spaceport_db_query_duration_seconds', (('query', name),), elapsed)
+
+        if cursor.rowcount > 0:
+            metrics.registry.inc('spaceport_db_rows_total', (('query', name),), cursor.rowcount)
+
+        if self.slow_query_threshold is not None and elapsed >= self.slow_query_threshold:
+            # A generator of parameters is spent by now, so only a list can be explained
+            first = parameters[0] if isinstance(parameters, (list, tuple)) and parameters else None
+            self.record_slow_query(sql, first, name, elapsed)
+
+        return cursor
+
+    def explain(self, sql, parameters):
+        # EXPLAIN QUERY PLAN compiles the statement with the same parameters without running it
+        try:
+            rows = super().execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+        except sqlite3.Error:
+            return None
+
+        depths = {}
+        plan = []
+        for node_id, parent, _, detail in rows:
+            depths[node_id] = depths.get(parent, -1) + 1
+            plan.append('  ' * depths[node_id] + detail)
+
+        return plan
+
+    def record_slow_query(self, sql, parameters, name, seconds):
+        shape = metrics.normalize_query(sql)
+
+        # Only the first occurrence of a shape pays for the plan and the log line
+        plan = None
+        if parameters is not None and not metrics.registry.has_slow_query(shape):
+            plan = self.explain(sql, parameters)
+
+        parameter_shape = metrics.parameter_shape(parameters) if parameters is not None else None
+        if metrics.registry.record_slow_query(shape, name, parameter_shape, seconds, plan):
+            plan_text = '\n'.join(plan) if plan else 'unavailable'
+            logger.warning(
+                f'Slow query {name} took {seconds:.3f}s: {shape} parameters={parameter_shape}\n'
+                f'Query plan:\n{plan_text}'
+            )
+
+    def get_statistics_generation(self):
+        try:
+            row = super().execute(
+                "SELECT generation FROM main.table_generations WHERE table_name = ?", (STATISTICS_TABLE,)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            # Not migrated yet
+            return None
+
+        return row[0] if row is not None else None
+
+    def reload_statistics(self):
+        # sqlite_stat1 is only read when the schema is loaded, and ANALYZE run elsewhere
+        # doesn't change the schema, so a long-lived connection would plan with stale
+        # statistics forever. ANALYZE of sqlite_master only reloads them.
+        now = time.monotonic()
+        if now - self.statistics_checked < STATISTICS_CHECK_INTERVAL:
+            return
+        self.statistics_checked = now
+
+        generation = self.get_statistics_generation()
+        if generation == self.statistics_generation:
+            return
+
+        for schema in sorted({'main', *self.table_schemas.values()}):
+            super().execute(f"ANALYZE {schema}.sqlite_master")
+        self.statistics_generation = generation
+
+    def begin(self, *tables):
+        # Take the write lock up front so the wait for it is measured on its own
+        if self.in_transaction:
+            return
+
+        started = time.perf_counter()
+        schemas = {self.schema(table) for table in tables}
+        if self.table_schemas and len(schemas) == 1:
+            # BEGIN IMMEDIATE locks every attached database. A no-op write locks only
+            # the one these tables live in, so events and the rest can be written in parallel.
+            super().execute("BEGIN")
+            super().execute(f"UPDATE {schemas.pop()}.table_generations SET generation = generation WHERE 0")
+        else:
+            super().execute("BEGIN IMMEDIATE")
+        metrics.timed('spaceport_db_lock_wait_seconds', (), started)
+
+    def touch(self, *tables):
+        # Record tables written in this transaction; their generations are bumped on commit
+        self.dirty_tables.update(tables)
+
+    def commit(self):
+        tables = set(self.dirty_tables)
+        if tables:
+            # Each database keeps the generations of its own tables
+            for schema in sorted({self.schema(table) for table in tables}):
+                self.executemany(
+                    f"UPDATE {schema}.table_generations SET generation = generation + 1 WHERE table_name = ?",
+                    [(table,) for table in sorted(tables) if self.schema(table) == schema],
+                    name='table_generation_bump'
+                )
+            self.dirty_tables.clear()
+
+        started = time.perf_counter()
+        super().commit()
+        metrics.timed('spaceport_db_commit_duration_seconds', (), started)
+
+        if tables:
+            for listener in commit_listeners:
+                listener(tables)
+
+    def rollback(self):
+        self.dirty_tables.clear()
+        super().rollback()
+
+
+def open_connection(database, uri=False):
+    db = sqlite3.connect(
+        database,
+        factory=Connection,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        cached_statements=current_app.config['SQLITE_CACHED_STATEMENTS'],
+        uri=uri
+    )
+    db.row_factory = sqlite3.Row
+    db.slow_query_threshold = current_app.config['SLOW_QUERY_THRESHOLD']
+    db.create_function('sha256', 1, sha256, deterministic=True)
+    return db
+
+
+def connect():
+    db = open_connection(current_app.config['DATABASE'])
+
+    for pragma, value in current_app.config['SQLITE_PRAGMAS'].items():
+        db.execute(f"PRAGMA {pragma} = {value}")
+
+    # Events in their own file have their own write lock, WAL and settings
+    if current_app.config['EVENTS_DATABASE']:
+        db.execute(f"ATTACH DATABASE ? AS {EVENTS_SCHEMA}", (current_app.config['EVENTS_DATABASE'],))
+        for pragma, value in current_app.config['EVENTS_SQLITE_PRAGMAS'].items():
+            db.execute(f"PRAGMA {EVENTS_SCHEMA}.{pragma} = {value}")
+        db.table_schemas = {'events': EVENTS_SCHEMA}
+
+    db.statistics_generation = db.get_statistics_generation()
+    return db
+
+
+def connection_key(*parts):
+    # Keyed by pid as well so a connection inherited through fork is never reused
+    return (os.getpid(), *parts)
+
+
+def get_connection():
+    connections = getattr(_connections, 'connections', None)
+    if connections is None:
+        connections = _connections.connections = {}
+
+    key = connection_key(current_app.config['DATABASE'], current_app.config['EVENTS_DATABASE'])
+    if key not in connections:
+        connections[key] = connect()
+    else:
+        connections[key].reload_statistics()
+
+    return connections[key]
 
 
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        if current_app.config['SQLITE_PERSISTENT_CONNECTIONS']:
+            g.db = get_connection()
+        else:
+            g.db = connect()
 
     return g.db
 
@@ -17,14 +246,83 @@ def get_db():
 def close_db(e=None):
     db = g.pop('db', None)
 
-    if db is not None:
+    if db is None:
+        return
+
+    if current_app.config['SQLITE_PERSISTENT_CONNECTIONS']:
+        # Keep the connection open for the next request but never leak a transaction into it
+        if db.in_transaction:
+            db.rollback()
+    else:
         db.close()
 
-def init_db():
+
+@contextmanager
+def migration_lock():
+    # A file lock next to the database serializes schema changes across gunicorn workers
+    with open(current_app.config['DATABASE'] + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_migrations():
+    migrations_dir = os.path.join(current_app.root_path, 'migrations')
+    migrations = []
+
+    for name in os.listdir(migrations_dir):
+        match = MIGRATION_FILENAME.match(name)
+        if match:
+            migrations.append((int(match.group(1)), name))
+
+    return sorted(migrations)
+
+
+def get_schema_version(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate_db():
     db = get_db()
+    migrations = get_migrations()
+    latest = migrations[-1][0] if migrations else 0
+
+    # Cheap check so an up to date database never waits on the lock
+    if get_schema_version(db) >= latest:
+        return
+
+    with migration_lock():
+        # Another worker may have applied the migrations while we waited
+        current = get_schema_version(db)
+
+        for version, name in migrations:
+            if version <= current:
+                continue
+
+            logger.info(f'Applying migration {name}')
+            with current_app.open_resource(f'migrations/{name}') as f:
+                script = f.read().decode('utf8')
+
+            try:
+                db.executescript(
+                    f"BEGIN;\n{script}\n"
+                    f"INSERT INTO schema_version (version, name) VALUES ({version}, '{name}');\n"
+                    "COMMIT;"
+                )
+            except Exception:
+                if db.in_transaction:
+                    db.rollback()
+                raise
 
-    with current_app.open_resource('schema.sql') as f:
-        db.executescript(f.read().decode('utf8'))
 
 def init_app(app):
-    app.teardown_appcontext(close_db)
\ No newline at end of file
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,112 @@
+import json
+import re
+from flask import current_app
+from .db import get_db, migration_lock
+from .logger import logger
+
+# Filters on paths inside events.event_data are written event_data.<path>
+FILTER_PREFIX = 'event_data.'
+
+# Object keys and array indexes only, so a path can be inlined into SQL safely
+PATH = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*|\[\d+\])*$')
+
+# A generated column as ensure_columns adds it, in the table's stored CREATE statement
+DEFINITION = re.compile(r"(\w+)\s+GENERATED ALWAYS AS \(json_extract\(event_data, '([^']*)'\)\)")
+
+
+def json_path(path):
+    return f'$.{path}'
+
+
+def column_name(path):
+    # Not unique, e.g. farm_index and farm.index share a name, so a column is only
+    # ever looked up through the configured path that created it
+    return 'data_' + re.sub(r'\W+', '_', path).strip('_')
+
+
+def parse_value(value):
+    # json_extract returns numbers as numbers, so '3' has to match 3. Anything that
+    # isn't a JSON scalar is compared as the string it arrived as.
+    try:
+        parsed = json.loads(value)
+    except (TypeError, ValueError):
+        return value
+
+    if isinstance(parsed, bool):
+        return int(parsed)
+    if isinstance(parsed, (int, float, str)):
+        return parsed
+    return value
+
+
+def filter_expression(path, table_columns):
+    # Declared paths have an indexed generated column; the rest are extracted per row.
+    # The path is a literal rather than a parameter so SQLite can match it to an index.
+    column = column_name(path)
+    if path in current_app.config['EVENT_DATA_INDEXES'] and column in table_columns:
+        return column
+    return f"json_extract(event_data, '{json_path(path)}')"
+
+
+def generated_columns(paths):
+    return {column_name(path): json_path(path) for path in paths}
+
+
+def defined_columns(db):
+    # Generated columns already on events, by the json path each one extracts
+    sql = db.execute(
+        f"SELECT sql FROM {db.schema('events')}.sqlite_master WHERE type = 'table' AND name = 'events'"
+    ).fetchone()['sql']
+    return dict(DEFINITION.findall(sql))
+
+
+def ensure_columns(db, paths):
+    # A column left by an earlier config may have been generated from another path
+    defined = defined_columns(db)
+    for path in paths:
+        column = column_name(path)
+        if column in defined and defined[column] != json_path(path):
+            raise ValueError(
+                f'Column {column} for event_data path {path} already extracts {defined[column]}'
+            )
+
+    existing = {row['name'] for row in db.execute("PRAGMA table_xinfo(events)").fetchall()}
+    missing = [path for path in paths if column_name(path) not in existing]
+    if not missing:
+        return
+
+    with migration_lock():
+        existing = {row['name'] for row in db.execute("PRAGMA table_xinfo(events)").fetchall()}
+
+        for path in missing:
+            column = column_name(path)
+            if column in existing:
+                continue
+
+            # VIRTUAL costs nothing per row on disk; the index holds the extracted values
+            logger.info(f'Adding generated column {column} for event_data path {json_path(path)}')
+            db.executescript(
+                f"""
+                BEGIN;
+                ALTER TABLE events ADD COLUMN {column}
+                GENERATED ALWAYS AS (json_extract(event_data, '{json_path(path)}')) VIRTUAL;
+                CREATE INDEX IF NOT EXISTS {db.schema('events')}.idx_events_{column} ON events ({column});
+                COMMIT;
+                """
+            )
+
+
+def init_app(app):
+    paths = app.config['EVENT_DATA_INDEXES']
+    columns = {}
+    for path in paths:
+        if not PATH.match(path):
+            raise ValueError(f'Invalid event_data path in EVENT_DATA_INDEXES: {path}')
+
+        other = columns.setdefault(column_name(path), path)
+        if other != path:
+            raise ValueError(f'event_data paths {other} and {path} in EVENT_DATA_INDEXES share column {column_name(path)}')
+
+    # Runs before the schema catalog is loaded, so the catalog sees the generated columns
+    with app.app_context():
+        ensure_columns(get_db(), paths)
@@ -0,0 +1,186 @@
+import threading
+from collections import deque
+from flask import current_app
+from . import db as database, metrics
+from .jobs import WorkerThread
+from .logger import logger
+
+# Events read per step while catching up with the table
+STREAM_BATCH_SIZE = 500
+
+
+class Subscription:
+    def __init__(self, filter_spec, filter_values, position, buffer_size):
+        self.key = (filter_spec, tuple(filter_values))
+        self.filter_spec = filter_spec
+        self.filter_values = filter_values
+        # Events up to here are sent from the database; later ones arrive through push()
+        self.position = position
+        self.buffer_size = buffer_size
+        self.rows = deque()
+        self.overflowed = False
+        self.condition = threading.Condition()
+
+    def push(self, rows):
+        with self.condition:
+            # A client that can't keep up is cut off rather than buffered without limit.
+            # It reconnects with Last-Event-ID and catches up from the database.
+            if self.overflowed:
+                return
+
+            if len(self.rows) + len(rows) > self.buffer_size:
+                self.overflowed = True
+                metrics.registry.inc('spaceport_stream_overflows_total')
+            else:
+                self.rows.extend(rows)
+
+            self.condition.notify()
+
+    def take(self, timeout):
+        with self.condition:
+            if not self.rows and not self.overflowed:
+                self.condition.wait(timeout)
+
+            rows = list(self.rows)
+            self.rows.clear()
+            return rows
+
+
+class EventBroadcaster(WorkerThread):
+    """
+    Tails the events table by event_id and fans new rows out to every subscription
+    in this worker. It wakes on local commits to events and polls for commits made
+    by other workers.
+    """
+
+    name = 'event-stream'
+
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+        self.poll_interval = app.config['STREAM_POLL_INTERVAL']
+        self.buffer_size = app.config['STREAM_CLIENT_BUFFER']
+        self.max_clients = app.config['STREAM_MAX_CLIENTS']
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.position = None
+        self.generation = None
+
+    def wake(self):
+        self.wakeup.set()
+
+    def notify(self, tables):
+        if 'events' in tables:
+            self.wakeup.set()
+
+    def subscribe(self, filter_spec, filter_values):
+        with self.lock:
+            if len(self.subscriptions) >= self.max_clients:
+                return None
+
+            self.ensure_started()
+            if self.position is None:
+                self.position = database.get_db().execute(
+                    "SELECT COALESCE(MAX(event_id), 0) FROM events"
+                ).fetchone()[0]
+
+            subscription = Subscription(filter_spec, filter_values, self.position, self.buffer_size)
+            self.subscriptions.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+            # Nothing to tail; the next subscriber starts from the end of the table again
+            if not self.subscriptions:
+                self.position = None
+                self.generation = None
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+            if self.stopping.is_set():
+                return
+
+            with self.lock:
+                subscriptions = list(self.subscriptions)
+            if not subscriptions:
+                continue
+
+            try:
+                with self.app.app_context():
+                    self.publish(subscriptions)
+            except Exception as e:
+                logger.error(f'Error publishing streamed events: {e}')
+
+    def publish(self, subscriptions):
+        from .api_db import APIDB, filter_query
+
+        db = database.get_db()
+
+        # Skip the read entirely when nothing was committed to events
+        generation = APIDB.get_generation('events')
+        if generation == self.generation:
+            return
+
+        groups = {}
+        for subscription in subscriptions:
+            groups.setdefault(subscription.key, []).append(subscription)
+
+        while True:
+            with self.lock:
+                position = self.position
+            if position is None:
+                return
+
+            rows = [
+                dict(row) for row in db.execute(
+                    "SELECT * FROM events WHERE event_id > ? ORDER BY event_id LIMIT ?",
+                    (position, STREAM_BATCH_SIZE),
+                    name='event_stream_tail'
+                ).fetchall()
+            ]
+            if not rows:
+                break
+
+            first, last = rows[0]['event_id'], rows[-1]['event_id']
+
+            # Each distinct filter runs once over just the new rowid range, using the same SQL as /get/events
+            for (filter_spec, filter_values), members in groups.items():
+                matched = rows
+                if filter_spec:
+                    event_ids = {
+                        row[0] for row in db.execute(
+                            f"SELECT event_id FROM events {filter_query(filter_spec, ['event_id BETWEEN ? AND ?'])}",
+                            list(filter_values) + [first, last],
+                            name='event_stream_filter'
+                        ).fetchall()
+                    }
+                    matched = [row for row in rows if row['event_id'] in event_ids]
+
+                for subscription in members:
+                    pending = [row for row in matched if row['event_id'] > subscription.position]
+                    if pending:
+                        subscription.push(pending)
+
+            with self.lock:
+                if self.position is not None:
+                    self.position = last
+
+            if len(rows) < STREAM_BATCH_SIZE:
+                break
+
+        self.generation = generation
+
+
+def get_event_broadcaster():
+    return current_app.extensions['event_broadcaster']
+
+
+def init_app(app):
+    broadcaster = app.extensions['event_broadcaster'] = EventBroadcaster(app)
+    database.commit_listeners.append(broadcaster.notify)
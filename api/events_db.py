@@ -0,0 +1,126 @@
+import re
+import time
+from flask import current_app
+from .db import EVENTS_SCHEMA, get_db, migration_lock
+from .jobs import PeriodicJob
+from .logger import logger
+
+# Tables the events database keeps for its own tables
+SUPPORT_TABLES = ('table_generations', 'row_counters')
+
+CREATE_STATEMENT = re.compile(r'^(CREATE\s+(?:UNIQUE\s+)?(?:TABLE|INDEX|TRIGGER)\s+(?:IF\s+NOT\s+EXISTS\s+)?)', re.IGNORECASE)
+
+
+def qualify(sql, schema):
+    # CREATE statements as stored in sqlite_master, recreated in another schema
+    return CREATE_STATEMENT.sub(rf'\1{schema}.', sql, count=1)
+
+
+def has_table(db, schema, table):
+    return db.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+def move_events(db):
+    """
+    Moves the events table, with its indexes, triggers, row counters and generation,
+    from the main database into the attached events database. Migrations create events
+    in main, so this runs once when EVENTS_DATABASE is first set.
+    """
+    if not has_table(db, 'main', 'events'):
+        return
+
+    with migration_lock():
+        if not has_table(db, 'main', 'events'):
+            return
+
+        if has_table(db, EVENTS_SCHEMA, 'events'):
+            # A fresh main database next to an existing events database
+            if db.execute("SELECT 1 FROM main.events LIMIT 1").fetchone() is not None:
+                raise RuntimeError('events exists in both DATABASE and EVENTS_DATABASE')
+
+            logger.info('Dropping the empty events table from the main database')
+            db.begin()
+            db.execute("DROP TABLE main.events")
+            db.execute("DELETE FROM main.row_counters WHERE table_name = 'events'")
+            db.execute("DELETE FROM main.table_generations WHERE table_name = 'events'")
+            db.commit()
+            return
+
+        started = time.perf_counter()
+        objects = db.execute(
+            """
+            SELECT type, name, tbl_name, sql FROM main.sqlite_master
+            WHERE (tbl_name = 'events' OR (type = 'table' AND name IN (?, ?))) AND sql IS NOT NULL
+            """,
+            SUPPORT_TABLES
+        ).fetchall()
+        statements = {kind: [qualify(row['sql'], EVENTS_SCHEMA) for row in objects if row['type'] == kind]
+                      for kind in ('table', 'index', 'trigger')}
+
+        # Generated columns are computed, so only stored columns are copied
+        columns = [
+            row['name'] for row in db.execute("PRAGMA main.table_xinfo(events)").fetchall()
+            if row['hidden'] not in (2, 3)
+        ]
+        column_list = ', '.join(columns)
+
+        db.begin()
+        try:
+            for sql in statements['table']:
+                db.execute(sql)
+
+            # Rows first and triggers last, so the copy isn't counted twice
+            db.execute(
+                f"INSERT INTO {EVENTS_SCHEMA}.events ({column_list}) SELECT {column_list} FROM main.events",
+                name='events_database_copy'
+            )
+            for sql in statements['index']:
+                db.execute(sql)
+
+            for table in SUPPORT_TABLES:
+                db.execute(f"INSERT INTO {EVENTS_SCHEMA}.{table} SELECT * FROM main.{table} WHERE table_name = 'events'")
+                db.execute(f"DELETE FROM main.{table} WHERE table_name = 'events'")
+
+            # Keep AUTOINCREMENT from reusing ids of events deleted from the end of the table
+            db.execute(f"DELETE FROM {EVENTS_SCHEMA}.sqlite_sequence WHERE name = 'events'")
+            db.execute(
+                f"INSERT INTO {EVENTS_SCHEMA}.sqlite_sequence (name, seq) "
+                "SELECT name, seq FROM main.sqlite_sequence WHERE name = 'events'"
+            )
+
+            for sql in statements['trigger']:
+                db.execute(sql)
+
+            db.execute("DROP TABLE main.events")
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        logger.info(f'Moved events into {current_app.config["EVENTS_DATABASE"]} in {time.perf_counter() - started:.2f}s')
+
+
+class CheckpointJob(PeriodicJob):
+    name = 'events-checkpoint'
+
+    def __init__(self, app):
+        super().__init__(app, app.config['EVENTS_CHECKPOINT_INTERVAL'])
+
+    def run_once(self):
+        # Commits still autocheckpoint, which never shrinks the WAL. Truncate it here
+        # so the file a burst grew goes back to zero.
+        get_db().execute(f"PRAGMA {EVENTS_SCHEMA}.wal_checkpoint(TRUNCATE)")
+
+
+def init_app(app):
+    if not app.config['EVENTS_DATABASE']:
+        return
+
+    with app.app_context():
+        move_events(get_db())
+
+    if app.config['EVENTS_CHECKPOINT_INTERVAL']:
+        job = app.extensions['events_checkpoint'] = CheckpointJob(app)
+        job.install()
@@ -0,0 +1,98 @@
+import threading
+from collections import OrderedDict
+from flask import current_app, g
+
+CACHE_NAME = 'farm_public_keys'
+
+
+class FarmerIdCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.generation = None
+        self.lock = threading.Lock()
+
+    def sync(self, generation):
+        # Another worker changed a farm's public key since we filled the cache
+        with self.lock:
+            if generation != self.generation:
+                self.entries.clear()
+                self.generation = generation
+
+    def get(self, public_key):
+        with self.lock:
+            if public_key not in self.entries:
+                return None
+
+            self.entries.move_to_end(public_key)
+            return self.entries[public_key]
+
+    def put(self, public_key, farmer_id):
+        with self.lock:
+            self.entries[public_key] = farmer_id
+            self.entries.move_to_end(public_key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation = None
+
+
+def get_farmer_cache():
+    return current_app.extensions['farmer_cache']
+
+
+def get_generation(db):
+    # Read once per request so a batch of sector events costs a single lookup
+    if 'farmer_cache_generation' not in g:
+        g.farmer_cache_generation = db.execute(
+            "SELECT generation FROM cache_generations WHERE cache_name = ?", (CACHE_NAME,), name='cache_generation_lookup'
+        ).fetchone()[0]
+
+    return g.farmer_cache_generation
+
+
+def lookup_farmer_id(db, public_key):
+    cache = get_farmer_cache()
+    generation = get_generation(db)
+
+    # The mapping was changed earlier in this request; don't cache uncommitted rows
+    if generation is None:
+        return load_farmer_id(db, public_key)
+
+    cache.sync(generation)
+    farmer_id = cache.get(public_key)
+    if farmer_id is None:
+        farmer_id = load_farmer_id(db, public_key)
+        cache.put(public_key, farmer_id)
+
+    return farmer_id
+
+
+def load_farmer_id(db, public_key):
+    farm = db.execute(
+        """
+        SELECT farmer_id FROM farms WHERE farm_public_key = ?
+        """, (public_key,), name='farmer_id_lookup'
+    ).fetchone()
+
+    if farm:
+        return farm['farmer_id']
+
+    return "Unknown"
+
+
+def invalidate(db):
+    # Bumping the generation makes every worker drop its cached mappings
+    db.execute(
+        "UPDATE cache_generations SET generation = generation + 1 WHERE cache_name = ?", (CACHE_NAME,), name='cache_generation_bump'
+    )
+    get_farmer_cache().clear()
+    g.farmer_cache_generation = None
+
+
+def init_app(app):
+    app.extensions['farmer_cache'] = FarmerIdCache(app.config['FARMER_CACHE_SIZE'])
@@ -0,0 +1,97 @@
+import sqlite3
+import threading
+import time
+from collections import deque
+from flask import current_app
+from .jobs import WorkerThread
+from .logger import logger
+
+# Attempts to write a batch before its records are dropped
+WRITE_ATTEMPTS = 3
+
+
+class IngestQueue(WorkerThread):
+    name = 'ingest-writer'
+
+    def __init__(self, app):
+        super().__init__()
+        self.app = app
+        self.depth = app.config['INGEST_QUEUE_DEPTH']
+        self.batch_size = app.config['INGEST_BATCH_SIZE']
+        self.batch_interval = app.config['INGEST_BATCH_INTERVAL']
+        self.records = deque()
+        self.condition = threading.Condition()
+
+    def offer(self, records):
+        # All or nothing, so a batch request is never half accepted
+        with self.condition:
+            if len(self.records) + len(records) > self.depth:
+                return False
+
+            self.ensure_started()
+            self.records.extend(records)
+            self.condition.notify()
+            return True
+
+    def stop(self):
+        if self.started():
+            logger.info(f'Flushing {len(self.records)} queued records before shutdown')
+        super().stop()
+
+    def wake(self):
+        with self.condition:
+            self.condition.notify()
+
+    def next_batch(self):
+        with self.condition:
+            while not self.records and not self.stopping.is_set():
+                self.condition.wait()
+
+            # Give the batch a chance to fill, but never hold records longer than batch_interval
+            deadline = time.monotonic() + self.batch_interval
+            while len(self.records) < self.batch_size and not self.stopping.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            return [self.records.popleft() for _ in range(min(self.batch_size, len(self.records)))]
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if not batch:
+                return
+
+            self.write(batch)
+
+    def write(self, batch):
+        from .api_db import APIDB
+
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                with self.app.app_context():
+                    results = APIDB.insert_records(batch)
+                break
+            except sqlite3.OperationalError as e:
+                logger.error(f'Error writing queued batch (attempt {attempt}): {e}')
+                time.sleep(attempt)
+            except Exception as e:
+                logger.error(f'Error writing queued batch: {e}')
+                return
+        else:
+            logger.error(f'Dropped {len(batch)} queued records after {WRITE_ATTEMPTS} attempts')
+            return
+
+        for (entity, record), result in zip(batch, results):
+            if result['status_code'] >= 400:
+                logger.error(f"Queued {entity} record failed: {result['message']}")
+
+
+def get_ingest_queue():
+    return current_app.extensions['ingest_queue']
+
+
+def init_app(app):
+    if app.config['INGEST_ASYNC']:
+        app.extensions['ingest_queue'] = IngestQueue(app)
@@ -0,0 +1,136 @@
+import atexit
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app
+from .logger import logger
+
+
+@contextmanager
+def job_lock(name):
+    # Non-blocking, so only one worker runs a job at a time and the others skip the run
+    with open(f"{current_app.config['DATABASE']}.{name}.lock", 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class WorkerThread:
+    """A daemon thread running run() in this worker process, stopped and joined at exit"""
+
+    name = None
+
+    def __init__(self):
+        self.stopping = threading.Event()
+        self.thread = None
+        self.pid = None
+
+    def started(self):
+        return self.thread is not None and self.pid == os.getpid()
+
+    def ensure_started(self):
+        # Start lazily, and again after a fork, since threads don't survive fork
+        if self.started():
+            return
+
+        self.pid = os.getpid()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if not self.started():
+            return
+
+        self.stopping.set()
+        self.wake()
+        self.thread.join()
+        self.thread = None
+
+    def wake(self):
+        # Threads that block on something other than self.stopping interrupt it here
+        pass
+
+    def run(self):
+        raise NotImplementedError
+
+
+class PeriodicJob(WorkerThread):
+    """Runs run_once() every interval seconds on a daemon thread, in one worker at a time"""
+
+    # Jobs that maintain state of their own worker set this to False to run in every worker
+    exclusive = True
+
+    def __init__(self, app, interval):
+        super().__init__()
+        self.app = app
+        self.interval = interval
+        self.last_run = None
+
+    def install(self):
+        # Start in the worker that creates the app, and again in each worker forked from it
+        self.ensure_started()
+        self.app.before_request(self.ensure_started)
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                with self.app.app_context():
+                    if not self.exclusive:
+                        self.record_run()
+                    else:
+                        with job_lock(self.name) as acquired:
+                            if acquired:
+                                self.record_run()
+            except Exception as e:
+                logger.error(f'Error running {self.name}: {e}')
+
+            self.stopping.wait(self.interval)
+
+    def record_run(self):
+        started = time.perf_counter()
+        result = self.run_once()
+
+        self.last_run = {
+            'finished_at': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()),
+            'duration_seconds': round(time.perf_counter() - started, 3),
+            **(result or {})
+        }
+
+    def run_once(self):
+        # May return a dict of details to keep in last_run
+        raise NotImplementedError
+
+    def delete_in_batches(self, db, table, where, parameters, batch_size, name, pause=0):
+        deleted = 0
+
+        # Small transactions so the write lock is never held for long
+        while not self.stopping.is_set():
+            db.begin(table)
+            cursor = db.execute(
+                f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)",
+                (*parameters, batch_size),
+                name=name
+            )
+            if cursor.rowcount > 0:
+                db.touch(table)
+            db.commit()
+
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+
+            if pause:
+                time.sleep(pause)
+
+        return deleted
@@ -0,0 +1,276 @@
+import atexit
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from flask import g, request
+
+# Upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRICS = {
+    'spaceport_http_requests_total': ('counter', 'HTTP requests by route, method, entity and status'),
+    'spaceport_http_request_duration_seconds': ('histogram', 'HTTP request latency by route and entity'),
+    'spaceport_db_query_duration_seconds': ('histogram', 'SQLite statement execution time by logical query name'),
+    'spaceport_db_rows_total': ('counter', 'Rows written or returned by logical query name'),
+    'spaceport_db_commit_duration_seconds': ('histogram', 'SQLite commit duration'),
+    'spaceport_db_lock_wait_seconds': ('histogram', 'Time spent acquiring the SQLite write lock'),
+    'spaceport_events_pruned_total': ('counter', 'Events deleted by the retention policy by level'),
+    'spaceport_vacuum_pages_total': ('counter', 'Pages returned to the filesystem by incremental vacuum'),
+    'spaceport_retention_run_seconds': ('histogram', 'Duration of retention runs'),
+    'spaceport_events_archived_total': ('counter', 'Events moved into archive segments'),
+    'spaceport_archive_segments_read_total': ('counter', 'Archive segments read by queries and exports'),
+    'spaceport_stream_events_sent_total': ('counter', 'Events sent to /stream/events clients'),
+    'spaceport_stream_overflows_total': ('counter', 'Stream clients disconnected for falling too far behind'),
+    'spaceport_replica_refresh_seconds': ('histogram', 'Time taken to copy the database into the read replica')
+}
+
+WHITESPACE = re.compile(r'\s+')
+PLACEHOLDER_LIST = re.compile(r'\?(\s*,\s*\?)+')
+
+
+def normalize_query(sql):
+    # Queries differing only in layout or in the length of a placeholder list share a shape
+    return PLACEHOLDER_LIST.sub('?, ...', WHITESPACE.sub(' ', sql).strip())
+
+
+def parameter_shape(parameters):
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters]
+
+
+class Registry:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.slow_queries = {}
+        self.slow_query_limit = 100
+        self.lock = threading.Lock()
+        self.directory = None
+        self.flush_interval = None
+        self.last_flush = 0
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[0][index] += 1
+                    break
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def has_slow_query(self, shape):
+        with self.lock:
+            return shape in self.slow_queries
+
+    def record_slow_query(self, shape, name, parameters, seconds, plan=None):
+        # Returns True the first time a shape is seen, so the caller logs it only once
+        with self.lock:
+            entry = self.slow_queries.get(shape)
+            if entry is None:
+                if len(self.slow_queries) >= self.slow_query_limit:
+                    return False
+
+                entry = self.slow_queries[shape] = {
+                    'query': shape,
+                    'name': name,
+                    'parameters': parameters,
+                    'plan': plan,
+                    'count': 0,
+                    'total_seconds': 0.0,
+                    'max_seconds': 0.0,
+                    'first_seen': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+                }
+                new = True
+            else:
+                new = False
+
+            entry['count'] += 1
+            entry['total_seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+            return new
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [
+                    [name, list(labels), list(buckets), total, count]
+                    for (name, labels), (buckets, total, count) in self.histograms.items()
+                ],
+                'slow_queries': [dict(entry) for entry in self.slow_queries.values()]
+            }
+
+    def flush(self, force=False):
+        # Each worker writes its own file; /metrics merges them so totals span every worker
+        if self.directory is None:
+            return
+
+        now = time.monotonic()
+        if not force and now - self.last_flush < self.flush_interval:
+            return
+        self.last_flush = now
+
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        try:
+            with open(f'{path}.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(f'{path}.tmp', path)
+        except OSError:
+            # Metrics must never fail a request, e.g. when the directory was cleaned up
+            pass
+
+
+registry = Registry()
+
+
+def timed(name, labels, started):
+    registry.observe(name, labels, time.perf_counter() - started)
+
+
+def collect(directory):
+    counters = {}
+    histograms = {}
+    slow_queries = {}
+
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json'):
+            continue
+
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+
+        for name, labels, buckets, total, count in snapshot['histograms']:
+            key = (name, tuple(tuple(label) for label in labels))
+            merged = histograms.setdefault(key, [[0] * len(BUCKETS), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+
+        for entry in snapshot.get('slow_queries', []):
+            merged = slow_queries.get(entry['query'])
+            if merged is None:
+                slow_queries[entry['query']] = entry
+                continue
+
+            merged['count'] += entry['count']
+            merged['total_seconds'] += entry['total_seconds']
+            merged['max_seconds'] = max(merged['max_seconds'], entry['max_seconds'])
+            merged['first_seen'] = min(merged['first_seen'], entry['first_seen'])
+            merged['plan'] = merged['plan'] or entry['plan']
+
+    return counters, histograms, slow_queries
+
+
+def format_labels(labels, extra=()):
+    labels = list(labels) + list(extra)
+    if not labels:
+        return ''
+
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels) + '}'
+
+
+def render():
+    registry.flush(force=True)
+    counters, histograms, _ = collect(registry.directory)
+    lines = []
+
+    for name, (metric_type, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+
+        if metric_type == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+            continue
+
+        for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS, buckets):
+                cumulative += bucket
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_bucket{format_labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{format_labels(labels)} {total}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def slow_queries():
+    registry.flush(force=True)
+    _, _, entries = collect(registry.directory)
+    return sorted(entries.values(), key=lambda entry: entry['total_seconds'], reverse=True)
+
+
+def before_request():
+    g.request_started = time.perf_counter()
+
+
+def entity_label():
+    from .api_db import INSERT_METHODS
+    from .catalog import ENTITIES
+
+    # Any path segment a client sends would otherwise become a new series in every worker
+    entity = (request.view_args or {}).get('entity', '')
+    if entity and entity not in INSERT_METHODS and entity not in ENTITIES:
+        return 'unknown'
+
+    return entity
+
+
+def after_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    entity = entity_label()
+
+    registry.inc('spaceport_http_requests_total', (
+        ('route', route), ('method', request.method), ('entity', entity), ('status', response.status_code)
+    ))
+    timed('spaceport_http_request_duration_seconds', (('route', route), ('entity', entity)), started)
+    registry.flush()
+
+    return response
+
+
+def init_app(app):
+    # Workers of the same gunicorn master share a directory, keyed by the master's pid
+    directory = app.config['METRICS_DIR'] or os.path.join(tempfile.gettempdir(), f'spaceport-api-metrics-{os.getppid()}')
+    os.makedirs(directory, exist_ok=True)
+
+    registry.directory = directory
+    registry.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+    registry.slow_query_limit = app.config['SLOW_QUERY_LOG_SIZE']
+    atexit.register(registry.flush, force=True)
+
+    app.before_request(before_request)
+    app.after_request(after_request)
@@ -1,9 +1,8 @@
--- Enable foreign key support
-PRAGMA foreign_keys = ON;
+-- Initial schema. Uses IF NOT EXISTS so databases created before migrations
+-- were introduced are adopted without losing data.
 
 -- EVENTS
-DROP TABLE IF EXISTS events;
-CREATE TABLE events (
+CREATE TABLE IF NOT EXISTS events (
     event_id INTEGER PRIMARY KEY AUTOINCREMENT,
     event_name TEXT NOT NULL,
     event_type TEXT NOT NULL,
@@ -17,8 +16,7 @@ CREATE TABLE events (
 );
 
 -- CONTAINERS
-DROP TABLE IF EXISTS containers;
-CREATE TABLE containers (
+CREATE TABLE IF NOT EXISTS containers (
     container_id TEXT PRIMARY KEY,
     container_type TEXT NOT NULL,
     container_alias TEXT NOT NULL,
@@ -32,9 +30,7 @@ CREATE TABLE containers (
     updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
-DROP TRIGGER IF EXISTS set_containers_timestamp;
-
-CREATE TRIGGER set_containers_timestamp
+CREATE TRIGGER IF NOT EXISTS set_containers_timestamp
 AFTER UPDATE ON containers
 FOR EACH ROW
 BEGIN
@@ -44,8 +40,7 @@ BEGIN
 END;
 
 -- FARMERS
-DROP TABLE IF EXISTS farmers;
-CREATE TABLE farmers (
+CREATE TABLE IF NOT EXISTS farmers (
     farmer_id TEXT PRIMARY KEY,
     container_id TEXT,
     farmer_reward_address TEXT,
@@ -55,9 +50,7 @@ CREATE TABLE farmers (
     FOREIGN KEY (container_id) REFERENCES containers(container_id) ON DELETE CASCADE
 );
 
-DROP TRIGGER IF EXISTS set_farmers_timestamp;
-
-CREATE TRIGGER set_farmers_timestamp
+CREATE TRIGGER IF NOT EXISTS set_farmers_timestamp
 AFTER UPDATE ON farmers
 FOR EACH ROW
 BEGIN
@@ -67,8 +60,7 @@ BEGIN
 END;
 
 -- FARMS
-DROP TABLE IF EXISTS farms;
-CREATE TABLE farms (
+CREATE TABLE IF NOT EXISTS farms (
     farm_index INTEGER NOT NULL,
     farmer_id TEXT,
     farm_id TEXT,
@@ -86,9 +78,7 @@ CREATE TABLE farms (
     PRIMARY KEY(farmer_id, farm_index)
 );
 
-DROP TRIGGER IF EXISTS set_farms_timestamp;
-
-CREATE TRIGGER set_farms_timestamp
+CREATE TRIGGER IF NOT EXISTS set_farms_timestamp
 AFTER UPDATE ON farms
 FOR EACH ROW
 BEGIN
@@ -98,8 +88,7 @@ BEGIN
 END;
 
 -- SECTORS
-DROP TABLE IF EXISTS sectors;
-CREATE TABLE sectors (
+CREATE TABLE IF NOT EXISTS sectors (
     sector_id INTEGER PRIMARY KEY AUTOINCREMENT,
     sector_index INTEGER, -- Sector being plotted
     public_key TEXT, -- Public key for farm
@@ -114,9 +103,7 @@ CREATE TABLE sectors (
     FOREIGN KEY(farmer_id) REFERENCES farmers(farmer_id) ON DELETE CASCADE
 );
 
-DROP TRIGGER IF EXISTS set_sectors_timestamp;
-
-CREATE TRIGGER set_sectors_timestamp
+CREATE TRIGGER IF NOT EXISTS set_sectors_timestamp
 AFTER UPDATE ON sectors
 FOR EACH ROW
 BEGIN
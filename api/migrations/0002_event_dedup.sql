@@ -0,0 +1,14 @@
+-- Deduplicate events on a content hash of event_data backed by a UNIQUE index
+ALTER TABLE events ADD COLUMN event_data_hash TEXT;
+
+UPDATE events SET event_data_hash = sha256(event_data);
+
+-- Drop duplicates that slipped in before the constraint existed, keeping the first copy
+DELETE FROM events
+WHERE event_id NOT IN (
+    SELECT MIN(event_id) FROM events
+    GROUP BY event_container_id, event_datetime, event_data_hash
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_events_dedup
+ON events (event_container_id, event_datetime, event_data_hash);
@@ -0,0 +1,11 @@
+-- Writes now set updated_at inline, so the AFTER UPDATE triggers that issued a
+-- second UPDATE per row are no longer needed
+DROP TRIGGER IF EXISTS set_containers_timestamp;
+DROP TRIGGER IF EXISTS set_farmers_timestamp;
+DROP TRIGGER IF EXISTS set_farms_timestamp;
+DROP TRIGGER IF EXISTS set_sectors_timestamp;
+
+-- Bumped by every upsert that updates an existing row; 0 means never updated
+ALTER TABLE containers ADD COLUMN revision INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE farmers ADD COLUMN revision INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE farms ADD COLUMN revision INTEGER NOT NULL DEFAULT 0;
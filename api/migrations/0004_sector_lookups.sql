@@ -0,0 +1,8 @@
+-- Open sector lookups by (public_key, sector_index) within the last hour
+CREATE INDEX IF NOT EXISTS idx_sectors_open
+ON sectors (public_key, sector_index, created_at)
+WHERE complete = 0;
+
+-- Resolving farmer_id from a sector's public key
+CREATE INDEX IF NOT EXISTS idx_farms_public_key
+ON farms (farm_public_key);
@@ -0,0 +1,7 @@
+-- Generation counters that let every worker notice when a shared cache is stale
+CREATE TABLE IF NOT EXISTS cache_generations (
+    cache_name TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO cache_generations (cache_name) VALUES ('farm_public_keys');
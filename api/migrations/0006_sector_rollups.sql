@@ -0,0 +1,46 @@
+-- Completed sector counts and plot times per minute/hour bucket, per plotter and per farmer.
+-- Maintained by update_complete_sector in the same transaction as the sector itself.
+CREATE TABLE IF NOT EXISTS sector_rollups (
+    bucket_size TEXT NOT NULL, -- 'minute' or 'hour'
+    bucket_start TEXT NOT NULL, -- Start of the bucket, e.g. 2024-01-01 13:00:00
+    dimension TEXT NOT NULL, -- 'plotter' or 'farmer'
+    dimension_value TEXT NOT NULL, -- plotter_id or farmer_id
+    sectors INTEGER NOT NULL DEFAULT 0, -- Sectors completed
+    errored INTEGER NOT NULL DEFAULT 0, -- Sectors that errored out
+    timed_sectors INTEGER NOT NULL DEFAULT 0, -- Completed sectors with a known plot time
+    plot_time_total INTEGER NOT NULL DEFAULT 0,
+    plot_time_min INTEGER,
+    plot_time_max INTEGER,
+    PRIMARY KEY (bucket_size, dimension, dimension_value, bucket_start)
+);
+
+-- Backfill from the sectors already recorded
+INSERT INTO sector_rollups (
+    bucket_size, bucket_start, dimension, dimension_value, sectors, errored,
+    timed_sectors, plot_time_total, plot_time_min, plot_time_max
+)
+SELECT bucket_size, bucket_start, dimension, dimension_value,
+    SUM(complete = 1),
+    SUM(complete = 2),
+    SUM(complete = 1 AND started_at IS NOT NULL),
+    COALESCE(SUM(CASE WHEN complete = 1 AND started_at IS NOT NULL THEN plot_time_seconds END), 0),
+    MIN(CASE WHEN complete = 1 AND started_at IS NOT NULL THEN plot_time_seconds END),
+    MAX(CASE WHEN complete = 1 AND started_at IS NOT NULL THEN plot_time_seconds END)
+FROM (
+    SELECT 'minute' AS bucket_size, strftime('%Y-%m-%d %H:%M:00', finished_at) AS bucket_start,
+        'plotter' AS dimension, plotter_id AS dimension_value, complete, started_at, plot_time_seconds
+    FROM sectors
+    UNION ALL
+    SELECT 'hour', strftime('%Y-%m-%d %H:00:00', finished_at), 'plotter', plotter_id, complete, started_at, plot_time_seconds
+    FROM sectors
+    UNION ALL
+    SELECT 'minute', strftime('%Y-%m-%d %H:%M:00', finished_at), 'farmer', farmer_id, complete, started_at, plot_time_seconds
+    FROM sectors
+    UNION ALL
+    SELECT 'hour', strftime('%Y-%m-%d %H:00:00', finished_at), 'farmer', farmer_id, complete, started_at, plot_time_seconds
+    FROM sectors
+)
+WHERE complete IN (1, 2)
+AND bucket_start IS NOT NULL
+AND dimension_value IS NOT NULL
+GROUP BY bucket_size, bucket_start, dimension, dimension_value;
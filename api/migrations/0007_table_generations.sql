@@ -0,0 +1,9 @@
+-- Bumped once per committed transaction that writes to the table. Lets readers
+-- tell whether anything changed without looking at the table itself.
+CREATE TABLE IF NOT EXISTS table_generations (
+    table_name TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO table_generations (table_name)
+VALUES ('events'), ('containers'), ('farmers'), ('farms'), ('sectors');
@@ -0,0 +1,3 @@
+-- Retention finds each level's cutoff and its oldest rows without scanning the table
+CREATE INDEX IF NOT EXISTS idx_events_level_datetime
+ON events (event_level, event_datetime);
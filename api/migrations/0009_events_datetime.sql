@@ -0,0 +1,3 @@
+-- Time windows, sorting by event_datetime and finding the oldest day to archive
+CREATE INDEX IF NOT EXISTS idx_events_datetime
+ON events (event_datetime);
@@ -0,0 +1,199 @@
+-- Row counts per table ('' column) and per value of low-cardinality columns, kept
+-- in step by triggers so get_entity can answer total_rows without COUNT(*).
+-- The counted columns are mirrored by COUNTED_COLUMNS in api_db.py.
+CREATE TABLE IF NOT EXISTS row_counters (
+    table_name TEXT NOT NULL,
+    column_name TEXT NOT NULL,
+    column_value NOT NULL, -- Untyped so values compare the way they do in their own column
+    row_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (table_name, column_name, column_value)
+);
+
+-- events
+CREATE TRIGGER IF NOT EXISTS events_count_insert AFTER INSERT ON events
+BEGIN
+    INSERT INTO row_counters (table_name, column_name, column_value, row_count)
+    SELECT 'events', '', '', 1
+    UNION ALL
+    SELECT 'events', 'event_level', NEW.event_level, 1 WHERE NEW.event_level IS NOT NULL
+    UNION ALL
+    SELECT 'events', 'event_type', NEW.event_type, 1 WHERE NEW.event_type IS NOT NULL
+    ON CONFLICT DO UPDATE SET row_count = row_count + excluded.row_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS events_count_delete AFTER DELETE ON events
+BEGIN
+    INSERT INTO row_counters (table_name, column_name, column_value, row_count)
+    SELECT 'events', '', '', -1
+    UNION ALL
+    SELECT 'events', 'event_level', OLD.event_level, -1 WHERE OLD.event_level IS NOT NULL
+    UNION ALL
+    SELECT 'events', 'event_type', OLD.event_type, -1 WHERE OLD.event_type IS NOT NULL
+    ON CONFLICT DO UPDATE SET row_count = row_count + excluded.row_count;
+END;
+
+-- containers
+CREATE TRIGGER IF NOT EXISTS containers_count_insert AFTER INSERT ON containers
+BEGIN
+    INSERT INTO row_counters (table_name, column_name, column_value, row_count)
+    SELECT 'containers', '', '', 1
+    UNION ALL
+    SELECT 'containers', 'container_type', NEW.container_type, 1 WHERE NEW.container_type IS NOT NULL
+    UNION ALL
+    SELECT 'containers', 'container_status', NEW.container_status, 1 WHERE NEW.container_status IS NOT NULL
+    ON CONFLICT DO UPDATE SET row_count = row_count + excluded.row_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS containers_count_delete AFTER DELETE ON containers
+BEGIN
+    INSERT INTO row_counters (table_name, column_name, column_value, row_count)
+    SELECT 'containers', '', '', -1
+    UNION ALL
+    SELECT 'containers', 'container_type', OLD.container_type, -1 WHERE OLD.container_type IS NOT NULL
+    UNION ALL
+    SELECT 'containers', 'container_status', OLD.container_status, -1 WHERE OLD.container_status IS NOT NULL
+    ON CONFLICT DO UPDATE SET row_count = row_count + excluded.row_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS containers_count_update AFTER UPDATE OF container_type, container_status ON containers
+BEGIN
+    INSERT INTO row_counters (table_name, column_name, column_value, row_count)
+    SELECT 'containers', 'container_type', OLD.container_type, -1 WHERE OLD.container_type IS NOT NULL AND OLD.container_type IS NOT NEW.container_type
+    UNION ALL
+    SELECT 'containers', 'container_type', NEW.container_type, 1 WHERE NEW.container_type IS NOT NULL AND OLD.container_type IS NOT NEW.container_type
+    UNION ALL
+    SELECT 'containers', 'container_status', OLD.container_status, -1 WHERE OLD.container_status IS NOT NULL AND OLD.container_status IS NOT NEW.container_status
+    UNION ALL
+    SELECT 'containers', 'container_status', NEW.container_status, 1 WHERE NEW.container_status IS NOT NULL AND OLD.container_status IS NOT NEW.container_status
+    ON CONFLICT DO UPDATE SET row_count = row_count + excluded.row_count;
+END;
+
+-- farmers
+CREATE TRIGGER IF NOT EXISTS farmers_count_insert AFTER INSERT ON farmers
+BEGIN
+    INSERT INTO row_counters (table_name, column_name, column_value, row_count)
+    SELECT 'farmers', '', '', 1
+    UNION ALL
+    SELECT 'farmers', 'farmer_status', NEW.farmer_status, 1 WHERE NEW.farmer_status IS NOT NULL
+    ON CONFLICT DO UPDATE SET row_count = row_count + excluded.row_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS farmers_count_delete AFTER DELETE ON farmers
+BEGIN
+    INSERT INTO row_counters (table_name, column_name, column_value, row_count)
+    SELECT 'farmers', '', '', -1
+    UNION ALL
+    SELECT 'farmers', 'farmer_status', OLD.farmer_status, -1 WHERE OLD.farmer_status IS NOT NULL
+    ON CONFLICT DO UPDATE SET row_count = row_count + excluded.row_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS farmers_count_update AFTER UPDATE OF farmer_status ON farmers
+BEGIN
+    INSERT INTO row_counters (table_name, column_name, column_value, row_count)
+    SELECT 'farmers', 'farmer_status', OLD.farmer_status, -1 WHERE OLD.farmer_status IS NOT NULL AND OLD.farmer_status IS NOT NEW.farmer_status
+    UNION ALL
+    SELECT 'farmers', 'farmer_status', NEW.farmer_status, 1 WHERE NEW.farmer_status IS NOT NULL AND OLD.farmer_status IS NOT NEW.farmer_status
+    ON CONFLICT DO UPDATE SET row_count = row_count + excluded.row_count;
+END;
+
+-- farms
+CREATE TRIGGER IF NOT EXISTS farms_count_insert AFTER INSERT ON farms
+BEGIN
+    INSERT INTO row_counters (table_name, column_name, column_value, row_count)
+    SELECT 'farms', '', '', 1
+    UNION ALL
+    SELECT 'farms', 'farmer_id', NEW.farmer_id, 1 WHERE NEW.farmer_id IS NOT NULL
+    ON CONFLICT DO UPDATE SET row_count = row_count + excluded.row_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS farms_count_delete AFTER DELETE ON farms
+BEGIN
+    INSERT INTO row_counters (table_name, column_name, column_value, row_count)
+    SELECT 'farms', '', '', -1
+    UNION ALL
+    SELECT 'farms', 'farmer_id', OLD.farmer_id, -1 WHERE OLD.farmer_id IS NOT NULL
+    ON CONFLICT DO UPDATE SET row_count = row_count + excluded.row_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS farms_count_update AFTER UPDATE OF farmer_id ON farms
+BEGIN
+    INSERT INTO row_counters (table_name, column_name, column_value, row_count)
+    SELECT 'farms', 'farmer_id', OLD.farmer_id, -1 WHERE OLD.farmer_id IS NOT NULL AND OLD.farmer_id IS NOT NEW.farmer_id
+    UNION ALL
+    SELECT 'farms', 'farmer_id', NEW.farmer_id, 1 WHERE NEW.farmer_id IS NOT NULL AND OLD.farmer_id IS NOT NEW.farmer_id
+    ON CONFLICT DO UPDATE SET row_count = row_count + excluded.row_count;
+END;
+
+-- sectors
+CREATE TRIGGER IF NOT EXISTS sectors_count_insert AFTER INSERT ON sectors
+BEGIN
+    INSERT INTO row_counters (table_name, column_name, column_value, row_count)
+    SELECT 'sectors', '', '', 1
+    UNION ALL
+    SELECT 'sectors', 'complete', NEW.complete, 1 WHERE NEW.complete IS NOT NULL
+    UNION ALL
+    SELECT 'sectors', 'farmer_id', NEW.farmer_id, 1 WHERE NEW.farmer_id IS NOT NULL
+    UNION ALL
+    SELECT 'sectors', 'plotter_id', NEW.plotter_id, 1 WHERE NEW.plotter_id IS NOT NULL
+    ON CONFLICT DO UPDATE SET row_count = row_count + excluded.row_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS sectors_count_delete AFTER DELETE ON sectors
+BEGIN
+    INSERT INTO row_counters (table_name, column_name, column_value, row_count)
+    SELECT 'sectors', '', '', -1
+    UNION ALL
+    SELECT 'sectors', 'complete', OLD.complete, -1 WHERE OLD.complete IS NOT NULL
+    UNION ALL
+    SELECT 'sectors', 'farmer_id', OLD.farmer_id, -1 WHERE OLD.farmer_id IS NOT NULL
+    UNION ALL
+    SELECT 'sectors', 'plotter_id', OLD.plotter_id, -1 WHERE OLD.plotter_id IS NOT NULL
+    ON CONFLICT DO UPDATE SET row_count = row_count + excluded.row_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS sectors_count_update AFTER UPDATE OF complete, farmer_id, plotter_id ON sectors
+BEGIN
+    INSERT INTO row_counters (table_name, column_name, column_value, row_count)
+    SELECT 'sectors', 'complete', OLD.complete, -1 WHERE OLD.complete IS NOT NULL AND OLD.complete IS NOT NEW.complete
+    UNION ALL
+    SELECT 'sectors', 'complete', NEW.complete, 1 WHERE NEW.complete IS NOT NULL AND OLD.complete IS NOT NEW.complete
+    UNION ALL
+    SELECT 'sectors', 'farmer_id', OLD.farmer_id, -1 WHERE OLD.farmer_id IS NOT NULL AND OLD.farmer_id IS NOT NEW.farmer_id
+    UNION ALL
+    SELECT 'sectors', 'farmer_id', NEW.farmer_id, 1 WHERE NEW.farmer_id IS NOT NULL AND OLD.farmer_id IS NOT NEW.farmer_id
+    UNION ALL
+    SELECT 'sectors', 'plotter_id', OLD.plotter_id, -1 WHERE OLD.plotter_id IS NOT NULL AND OLD.plotter_id IS NOT NEW.plotter_id
+    UNION ALL
+    SELECT 'sectors', 'plotter_id', NEW.plotter_id, 1 WHERE NEW.plotter_id IS NOT NULL AND OLD.plotter_id IS NOT NEW.plotter_id
+    ON CONFLICT DO UPDATE SET row_count = row_count + excluded.row_count;
+END;
+
+-- Backfill from the existing rows
+INSERT OR REPLACE INTO row_counters (table_name, column_name, column_value, row_count)
+SELECT 'events', '', '', COUNT(*) FROM events;
+INSERT OR REPLACE INTO row_counters (table_name, column_name, column_value, row_count)
+SELECT 'events', 'event_level', event_level, COUNT(*) FROM events WHERE event_level IS NOT NULL GROUP BY event_level;
+INSERT OR REPLACE INTO row_counters (table_name, column_name, column_value, row_count)
+SELECT 'events', 'event_type', event_type, COUNT(*) FROM events WHERE event_type IS NOT NULL GROUP BY event_type;
+INSERT OR REPLACE INTO row_counters (table_name, column_name, column_value, row_count)
+SELECT 'containers', '', '', COUNT(*) FROM containers;
+INSERT OR REPLACE INTO row_counters (table_name, column_name, column_value, row_count)
+SELECT 'containers', 'container_type', container_type, COUNT(*) FROM containers WHERE container_type IS NOT NULL GROUP BY container_type;
+INSERT OR REPLACE INTO row_counters (table_name, column_name, column_value, row_count)
+SELECT 'containers', 'container_status', container_status, COUNT(*) FROM containers WHERE container_status IS NOT NULL GROUP BY container_status;
+INSERT OR REPLACE INTO row_counters (table_name, column_name, column_value, row_count)
+SELECT 'farmers', '', '', COUNT(*) FROM farmers;
+INSERT OR REPLACE INTO row_counters (table_name, column_name, column_value, row_count)
+SELECT 'farmers', 'farmer_status', farmer_status, COUNT(*) FROM farmers WHERE farmer_status IS NOT NULL GROUP BY farmer_status;
+INSERT OR REPLACE INTO row_counters (table_name, column_name, column_value, row_count)
+SELECT 'farms', '', '', COUNT(*) FROM farms;
+INSERT OR REPLACE INTO row_counters (table_name, column_name, column_value, row_count)
+SELECT 'farms', 'farmer_id', farmer_id, COUNT(*) FROM farms WHERE farmer_id IS NOT NULL GROUP BY farmer_id;
+INSERT OR REPLACE INTO row_counters (table_name, column_name, column_value, row_count)
+SELECT 'sectors', '', '', COUNT(*) FROM sectors;
+INSERT OR REPLACE INTO row_counters (table_name, column_name, column_value, row_count)
+SELECT 'sectors', 'complete', complete, COUNT(*) FROM sectors WHERE complete IS NOT NULL GROUP BY complete;
+INSERT OR REPLACE INTO row_counters (table_name, column_name, column_value, row_count)
+SELECT 'sectors', 'farmer_id', farmer_id, COUNT(*) FROM sectors WHERE farmer_id IS NOT NULL GROUP BY farmer_id;
+INSERT OR REPLACE INTO row_counters (table_name, column_name, column_value, row_count)
+SELECT 'sectors', 'plotter_id', plotter_id, COUNT(*) FROM sectors WHERE plotter_id IS NOT NULL GROUP BY plotter_id;
@@ -0,0 +1,53 @@
+-- One row per farmer with its container and farms, for /get/overview. Refreshed for
+-- the affected farmers by the container, farmer and farm insert paths, in the same
+-- transaction. The refresh query is OVERVIEW_REFRESH in api_db.py.
+CREATE TABLE IF NOT EXISTS fleet_overview (
+    farmer_id TEXT PRIMARY KEY,
+    container_id TEXT,
+    farmer_status INTEGER,
+    farmer_reward_address TEXT,
+    container_alias TEXT,
+    container_type TEXT,
+    container_status TEXT,
+    container_image TEXT,
+    container_ip TEXT,
+    container_started_at TIMESTAMP,
+    farm_count INTEGER NOT NULL DEFAULT 0,
+    farms_plotted INTEGER NOT NULL DEFAULT 0, -- Farms with farm_initial_plot_complete set
+    plot_progress REAL, -- Average farm_plot_progress over the farms
+    farms TEXT NOT NULL DEFAULT '[]', -- JSON array of the farms, by farm_index
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Finding the farmers of a container when it changes
+CREATE INDEX IF NOT EXISTS idx_farmers_container_id
+ON farmers (container_id);
+
+-- Backfill from the farmers already registered
+INSERT OR REPLACE INTO fleet_overview (
+    farmer_id, container_id, farmer_status, farmer_reward_address,
+    container_alias, container_type, container_status, container_image, container_ip, container_started_at,
+    farm_count, farms_plotted, plot_progress, farms
+)
+SELECT
+    farmers.farmer_id, farmers.container_id, farmers.farmer_status, farmers.farmer_reward_address,
+    containers.container_alias, containers.container_type, containers.container_status,
+    containers.container_image, containers.container_ip, containers.container_started_at,
+    (SELECT COUNT(*) FROM farms WHERE farms.farmer_id = farmers.farmer_id),
+    (SELECT COUNT(*) FROM farms WHERE farms.farmer_id = farmers.farmer_id AND farm_initial_plot_complete = 1),
+    (SELECT AVG(farm_plot_progress) FROM farms WHERE farms.farmer_id = farmers.farmer_id),
+    (
+        SELECT json_group_array(json_object(
+            'farm_index', farm_index,
+            'farm_id', farm_id,
+            'farm_public_key', farm_public_key,
+            'farm_size', farm_size,
+            'farm_initial_plot_complete', farm_initial_plot_complete,
+            'farm_plot_progress', farm_plot_progress,
+            'farm_latest_sector', farm_latest_sector,
+            'updated_at', updated_at
+        ))
+        FROM (SELECT * FROM farms WHERE farms.farmer_id = farmers.farmer_id ORDER BY farm_index)
+    )
+FROM farmers
+LEFT JOIN containers ON containers.container_id = farmers.container_id;
@@ -0,0 +1,4 @@
+-- Bumped after the statistics job runs ANALYZE. Connections only read sqlite_stat1 when
+-- they load the schema, so persistent ones reload it when this generation moves.
+INSERT OR IGNORE INTO table_generations (table_name)
+VALUES ('sqlite_stat1');
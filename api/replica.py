@@ -0,0 +1,196 @@
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+from flask import current_app, g, request
+from . import metrics
+from .db import EVENTS_SCHEMA, connection_key, get_db, open_connection
+from .jobs import PeriodicJob
+
+# Routes served from the snapshot when a read replica is configured
+READ_ENDPOINTS = {'api_routes.get_entity', 'api_routes.get_overview'}
+
+# Reader connections, one per snapshot for each thread of each worker process
+_connections = threading.local()
+
+
+class Snapshot:
+    def __init__(self, key, uri, events_uri, taken_at):
+        self.key = key
+        self.uri = uri
+        self.events_uri = events_uri
+        self.taken_at = taken_at
+
+    def age(self):
+        return max(0.0, time.time() - self.taken_at)
+
+
+class ReadReplica:
+    """
+    A point-in-time copy of the database, made with SQLite's online backup API, that
+    /get/* reads from so dashboard queries never compete with ingest for the file.
+    'memory' keeps a copy in each worker; 'file' has one worker write a copy that
+    every worker opens read-only.
+    """
+
+    def __init__(self, app):
+        self.mode = app.config['READ_REPLICA']
+        self.path = app.config['READ_REPLICA_PATH'] or app.config['DATABASE'] + '.replica'
+        self.max_staleness = app.config['READ_REPLICA_MAX_STALENESS']
+        self.attach_events = bool(app.config['EVENTS_DATABASE'])
+        self.snapshot = None
+        # Connections that keep the in-memory copies alive, newest last
+        self.anchors = []
+        self.sequence = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def current(self):
+        if self.mode == 'memory':
+            with self.lock:
+                return self.snapshot
+
+        # Each refresh renames a new file into place, so the inode identifies the snapshot
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+        # Never written in place, so readers can skip locking entirely
+        uri = f'file:{quote(self.path)}?immutable=1'
+        events_uri = f'file:{quote(self.path)}.events?immutable=1' if self.attach_events else None
+        return Snapshot(stat.st_ino, uri, events_uri, stat.st_mtime)
+
+    def refresh(self, source):
+        started = time.time()
+
+        if self.mode == 'memory':
+            name = f'spaceport-replica-{os.getpid()}-{next(self.sequence)}'
+            uri = f'file:{name}?mode=memory&cache=shared'
+            events_uri = f'file:{name}-events?mode=memory&cache=shared' if self.attach_events else None
+
+            anchors = [sqlite3.connect(uri, uri=True)]
+            source.backup(anchors[0])
+            if events_uri:
+                anchors.append(sqlite3.connect(events_uri, uri=True))
+                source.backup(anchors[1], name=EVENTS_SCHEMA)
+
+            with self.lock:
+                self.snapshot = Snapshot(name, uri, events_uri, started)
+                self.anchors.append(anchors)
+                # The previous copy stays open for a request that picked it just before the
+                # swap; readers still connected to older ones keep those alive until they move on
+                expired = self.anchors[:-2]
+                del self.anchors[:-2]
+
+            for anchor in itertools.chain.from_iterable(expired):
+                anchor.close()
+            return
+
+        # Written beside the replica and renamed over it, so readers never see a partial copy
+        targets = [(self.path, 'main')]
+        if self.attach_events:
+            targets.insert(0, (f'{self.path}.events', EVENTS_SCHEMA))
+
+        for path, schema in targets:
+            if os.path.exists(f'{path}.tmp'):
+                os.remove(f'{path}.tmp')
+
+            target = sqlite3.connect(f'{path}.tmp')
+            try:
+                source.backup(target, name=schema)
+                # Readers open the copy as immutable, which needs a rollback journal file format
+                target.execute("PRAGMA journal_mode = DELETE")
+            finally:
+                target.close()
+
+            os.utime(f'{path}.tmp', (started, started))
+            os.replace(f'{path}.tmp', path)
+
+    def connection(self, snapshot):
+        def connect():
+            db = open_connection(snapshot.uri, uri=True)
+            if snapshot.events_uri:
+                db.execute(f"ATTACH DATABASE ? AS {EVENTS_SCHEMA}", (snapshot.events_uri,))
+                db.table_schemas = {'events': EVENTS_SCHEMA}
+            return db
+
+        if not current_app.config['SQLITE_PERSISTENT_CONNECTIONS']:
+            return connect()
+
+        key = connection_key(snapshot.key)
+        if getattr(_connections, 'key', None) != key:
+            previous = getattr(_connections, 'connection', None)
+            if previous is not None:
+                previous.close()
+
+            _connections.connection = connect()
+            _connections.key = key
+
+        return _connections.connection
+
+
+class ReplicaJob(PeriodicJob):
+    name = 'read-replica'
+
+    def __init__(self, app, replica):
+        super().__init__(app, app.config['READ_REPLICA_INTERVAL'])
+        self.replica = replica
+        # Each worker keeps its own in-memory copy; a replica file is written by one
+        self.exclusive = replica.mode == 'file'
+
+    def run_once(self):
+        started = time.perf_counter()
+        self.replica.refresh(get_db())
+        elapsed = time.perf_counter() - started
+        metrics.registry.observe('spaceport_replica_refresh_seconds', (('mode', self.replica.mode),), elapsed)
+
+
+def get_read_replica():
+    return current_app.extensions.get('read_replica')
+
+
+def before_request():
+    if request.endpoint not in READ_ENDPOINTS:
+        return
+
+    # A snapshot past the staleness bound, e.g. while refreshes fail, is skipped for the primary
+    snapshot = get_read_replica().current()
+    if snapshot is None or snapshot.age() > get_read_replica().max_staleness:
+        g.read_source = 'primary'
+        return
+
+    g.db = get_read_replica().connection(snapshot)
+    g.read_source = 'snapshot'
+    g.snapshot = snapshot
+
+
+def after_request(response):
+    source = g.pop('read_source', None)
+    if source is None:
+        return response
+
+    response.headers['X-Read-Source'] = source
+    response.headers['X-Max-Staleness'] = str(get_read_replica().max_staleness)
+
+    snapshot = g.pop('snapshot', None)
+    if snapshot is not None:
+        response.headers['X-Snapshot-Age'] = f'{snapshot.age():.3f}'
+
+    return response
+
+
+def init_app(app):
+    if not app.config['READ_REPLICA']:
+        return
+
+    if app.config['READ_REPLICA'] not in ('memory', 'file'):
+        raise ValueError(f"Invalid READ_REPLICA: {app.config['READ_REPLICA']}")
+
+    replica = app.extensions['read_replica'] = ReadReplica(app)
+
+    job = app.extensions['read_replica_job'] = ReplicaJob(app, replica)
+    job.install()
+    app.before_request(before_request)
+    app.after_request(after_request)
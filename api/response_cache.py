@@ -0,0 +1,40 @@
+import threading
+from collections import OrderedDict
+from flask import current_app
+
+
+class ResponseCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, generation):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            # Anything cached under an older generation is stale
+            if entry is None or entry[0] != generation:
+                return None
+
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, generation, response):
+        if self.max_size <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = (generation, response)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+def get_response_cache():
+    return current_app.extensions['response_cache']
+
+
+def init_app(app):
+    app.extensions['response_cache'] = ResponseCache(app.config['RESPONSE_CACHE_SIZE'])
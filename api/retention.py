@@ -0,0 +1,171 @@
+import click
+import time
+from flask import current_app
+from flask.cli import with_appcontext
+from . import metrics
+from .db import get_db, migration_lock
+from .jobs import PeriodicJob
+from .logger import logger
+from .table_stats import update_statistics
+
+# auto_vacuum value for INCREMENTAL
+INCREMENTAL = 2
+
+
+def enable_incremental_vacuum(db):
+    # New databases pick this up from SQLITE_PRAGMAS; existing ones need a one-off VACUUM,
+    # which rewrites the whole file under the write lock
+    schema = db.schema('events')
+    if db.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0] == INCREMENTAL:
+        return False
+
+    with migration_lock():
+        if db.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0] == INCREMENTAL:
+            return False
+
+        logger.info('Enabling incremental vacuum, rebuilding the database once')
+        db.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+        db.execute(f"VACUUM {schema}")
+        return True
+
+
+@click.command('enable-incremental-vacuum')
+@with_appcontext
+def enable_incremental_vacuum_command():
+    """Rebuild the events database once so retention can return freed pages."""
+    if enable_incremental_vacuum(get_db()):
+        click.echo('Enabled incremental vacuum.')
+    else:
+        click.echo('Incremental vacuum is already enabled.')
+
+
+class RetentionJob(PeriodicJob):
+    name = 'event-retention'
+
+    def __init__(self, app):
+        super().__init__(app, app.config['EVENT_RETENTION_INTERVAL'])
+        self.policy = app.config['EVENT_RETENTION']
+        self.batch_size = app.config['EVENT_RETENTION_BATCH_SIZE']
+        self.batch_pause = app.config['EVENT_RETENTION_BATCH_PAUSE']
+        self.vacuum_pages = app.config['EVENT_RETENTION_VACUUM_PAGES']
+        self.warned_vacuum = False
+
+    def rule(self, event_level):
+        return self.policy.get(event_level, self.policy.get('*'))
+
+    def cutoff(self, db, event_level, rule):
+        # Both limits reduce to an event_datetime before which the level's rows are deleted
+        cutoffs = []
+
+        if rule.get('max_age_days'):
+            cutoffs.append(db.execute(
+                "SELECT DATETIME('now', ?)", (f"-{rule['max_age_days']} days",)
+            ).fetchone()[0])
+
+        if rule.get('max_rows'):
+            row = db.execute(
+                """
+                SELECT event_datetime FROM events
+                WHERE event_level = ?
+                ORDER BY event_datetime DESC
+                LIMIT 1 OFFSET ?
+                """,
+                # The max_rows-th newest row; only rows older than it are deleted
+                (event_level, rule['max_rows'] - 1),
+                name='event_retention_cutoff'
+            ).fetchone()
+            if row is not None:
+                cutoffs.append(str(row[0]))
+
+        return max(cutoffs) if cutoffs else None
+
+    def vacuum(self, db):
+        # Pages are freed in whichever database holds events
+        schema = db.schema('events')
+        if db.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0] != INCREMENTAL:
+            # Converting needs a VACUUM that blocks writes, so it is left to the operator
+            if not self.warned_vacuum:
+                logger.warning('auto_vacuum is not INCREMENTAL, pruned pages stay in the file until '
+                               '"flask enable-incremental-vacuum" is run')
+                self.warned_vacuum = True
+            return 0
+
+        free_pages = db.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+        # execute() stops after the first page; executescript() runs the pragma to completion
+        db.executescript(f"PRAGMA {schema}.incremental_vacuum({int(self.vacuum_pages)})")
+        return free_pages - db.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+
+    def run_once(self):
+        db = get_db()
+        started = time.perf_counter()
+        pruned = {}
+
+        levels = [row[0] for row in db.execute("SELECT DISTINCT event_level FROM events")]
+        for event_level in levels:
+            rule = self.rule(event_level)
+            if not rule:
+                continue
+
+            cutoff = self.cutoff(db, event_level, rule)
+            if cutoff is None:
+                continue
+
+            count = self.delete_in_batches(
+                db, 'events', 'event_level = ? AND event_datetime < ?', (event_level, cutoff),
+                self.batch_size, 'event_retention_delete', self.batch_pause
+            )
+            if count:
+                pruned[event_level] = count
+                metrics.registry.inc('spaceport_events_pruned_total', (('level', event_level),), count)
+
+        pages = self.vacuum(db)
+        if pages:
+            metrics.registry.inc('spaceport_vacuum_pages_total', (), pages)
+
+        # Pruning moves row counts, and with them the plans the statistics should pick
+        update_statistics(db)
+
+        elapsed = time.perf_counter() - started
+        metrics.registry.observe('spaceport_retention_run_seconds', (), elapsed)
+        metrics.registry.flush()
+
+        if pruned or pages:
+            logger.info(f'Pruned {sum(pruned.values())} events {pruned} and reclaimed {pages} pages in {elapsed:.2f}s')
+
+        return {
+            'rows_pruned': pruned,
+            'pages_reclaimed': pages
+        }
+
+
+def get_retention_job():
+    return current_app.extensions.get('retention')
+
+
+def retention_stats():
+    # Totals come from the metrics files so they cover whichever worker did the pruning
+    metrics.registry.flush(force=True)
+    counters, histograms, _ = metrics.collect(metrics.registry.directory)
+    pruned = {
+        dict(labels)['level']: value
+        for (name, labels), value in counters.items()
+        if name == 'spaceport_events_pruned_total'
+    }
+    _, seconds, runs = histograms.get(('spaceport_retention_run_seconds', ()), (None, 0.0, 0))
+
+    return {
+        'runs': runs,
+        'seconds_total': round(seconds, 3),
+        'rows_pruned': pruned,
+        'pages_reclaimed': counters.get(('spaceport_vacuum_pages_total', ()), 0)
+    }
+
+
+def init_app(app):
+    app.cli.add_command(enable_incremental_vacuum_command)
+
+    if not app.config['EVENT_RETENTION']:
+        return
+
+    job = app.extensions['retention'] = RetentionJob(app)
+    job.install()
@@ -0,0 +1,82 @@
+import threading
+import time
+from flask import current_app
+
+# Sectors are only matched while they are younger than this, mirroring the
+# DATETIME('now', '-1 hour') window used by the sector queries
+OPEN_SECTOR_TTL = 3600
+
+# How often expired entries are swept out of the map
+PRUNE_INTERVAL = 60
+
+
+class OpenSectorTracker:
+    def __init__(self, ttl=OPEN_SECTOR_TTL):
+        self.ttl = ttl
+        self.sectors = {}
+        self.last_prune = time.time()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(public_key, sector_index):
+        # sector_index may arrive as a string; SQLite compares it as an integer either way
+        return (public_key, str(sector_index))
+
+    def load(self, db):
+        rows = db.execute(
+            """
+            SELECT sector_id, public_key, sector_index, strftime('%s', created_at) AS created
+            FROM sectors
+            WHERE complete = 0
+            AND created_at >= DATETIME('now', '-1 hour')
+            ORDER BY sector_id
+            """
+        ).fetchall()
+
+        with self.lock:
+            self.sectors = {
+                self.key(row['public_key'], row['sector_index']): (row['sector_id'], int(row['created']) + self.ttl)
+                for row in rows
+            }
+
+    def get(self, public_key, sector_index):
+        entry = self.sectors.get(self.key(public_key, sector_index))
+        if entry is None:
+            return None
+
+        sector_id, expires_at = entry
+        if expires_at <= time.time():
+            self.discard(public_key, sector_index)
+            return None
+
+        return sector_id
+
+    def add(self, public_key, sector_index, sector_id, created=None):
+        now = time.time()
+        expires_at = (created if created is not None else now) + self.ttl
+
+        with self.lock:
+            self.sectors[self.key(public_key, sector_index)] = (sector_id, expires_at)
+
+            if now - self.last_prune >= PRUNE_INTERVAL:
+                self.sectors = {key: entry for key, entry in self.sectors.items() if entry[1] > now}
+                self.last_prune = now
+
+    def discard(self, public_key, sector_index):
+        with self.lock:
+            self.sectors.pop(self.key(public_key, sector_index), None)
+
+
+def get_sector_tracker():
+    return current_app.extensions['sector_tracker']
+
+
+def init_app(app):
+    from .db import get_db
+
+    tracker = OpenSectorTracker()
+    app.extensions['sector_tracker'] = tracker
+
+    # Rebuild the map from the open rows already in the table
+    with app.app_context():
+        tracker.load(get_db())
@@ -0,0 +1,79 @@
+from .db import STATISTICS_TABLE, get_db
+from .jobs import PeriodicJob
+from .logger import logger
+
+# Tables whose plans depend on their statistics. Without them an event_level filter sorted
+# by event_id searches idx_events_level_datetime and then sorts every matching row.
+ANALYZED_TABLES = ('events', 'sectors')
+
+# Factor by which a table's row count may drift from its statistics before it is analyzed again
+ANALYZE_DRIFT = 2
+
+
+def analyzed_rows(db, table):
+    # The first number of a sqlite_stat1 row is the table's row count when it was analyzed
+    schema = db.schema(table)
+    if db.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is None:
+        return None
+
+    row = db.execute(f"SELECT stat FROM {schema}.sqlite_stat1 WHERE tbl = ? LIMIT 1", (table,)).fetchone()
+    return int(row['stat'].split()[0]) if row is not None else None
+
+
+def current_rows(db, table):
+    row = db.execute(
+        f"SELECT row_count FROM {db.schema(table)}.row_counters WHERE table_name = ? AND column_name = ''",
+        (table,)
+    ).fetchone()
+    return row['row_count'] if row is not None else 0
+
+
+def update_statistics(db):
+    """
+    Analyzes each of ANALYZED_TABLES that has no statistics yet or whose row count has
+    drifted by ANALYZE_DRIFT since, then lets PRAGMA optimize handle the other tables.
+    Returns the tables analyzed.
+    """
+    analyzed = []
+    for table in ANALYZED_TABLES:
+        rows = current_rows(db, table)
+        stats = analyzed_rows(db, table)
+        if not rows or (stats is not None and stats * ANALYZE_DRIFT > rows and rows * ANALYZE_DRIFT > stats):
+            continue
+
+        # PRAGMA optimize alone only analyzes tables its own connection has queried
+        # before SQLite 3.46, so a fresh connection would never analyze these
+        db.execute(f"ANALYZE {db.schema(table)}.{table}", name='table_analyze')
+        analyzed.append(table)
+
+    db.execute("PRAGMA optimize")
+
+    # Other connections keep the statistics they loaded until told to reload them
+    if analyzed:
+        db.begin(STATISTICS_TABLE)
+        db.touch(STATISTICS_TABLE)
+        db.commit()
+
+    return analyzed
+
+
+class StatisticsJob(PeriodicJob):
+    name = 'table-statistics'
+
+    def __init__(self, app):
+        super().__init__(app, app.config['STATISTICS_INTERVAL'])
+
+    def run_once(self):
+        analyzed = update_statistics(get_db())
+        if analyzed:
+            logger.info(f"Analyzed {', '.join(analyzed)}")
+
+        return {'tables_analyzed': analyzed}
+
+
+def init_app(app):
+    if not app.config['STATISTICS_INTERVAL']:
+        return
+
+    job = app.extensions['table_statistics'] = StatisticsJob(app)
+    job.install()
@@ -0,0 +1,346 @@
+"""
+Load test for the ingest and query paths.
+
+Builds the app against a temporary database, replays synthetic fleet traffic
+through APIDB and reports throughput and p50/p99 latency per method as JSON:
+
+    python -m benchmarks.benchmark --sizes 1000,10000,100000 --output results.json
+    python -m benchmarks.benchmark --compare results.json
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from api import create_app
+from api.api_db import APIDB, encode_cursor
+from api.db import get_db
+from api.logger import logger
+from api.table_stats import update_statistics
+
+BASE_TIME = datetime(2024, 1, 1)
+EVENT_LEVELS = ['INFO'] * 8 + ['WARN', 'ERROR']
+EVENT_NAMES = ['Farm Plotting', 'Piece Cache Sync', 'Sector Plotted', 'Reward', 'Node Synced']
+FILL_BATCH_SIZE = 500
+
+
+class Fleet:
+    """Deterministic synthetic traffic for a fleet of farmers, farms and plotters"""
+
+    def __init__(self, seed, farmers, farms_per_farmer, plotters):
+        self.random = random.Random(seed)
+        self.clock = BASE_TIME
+        self.farmers = [f'farmer-{index}' for index in range(farmers)]
+        self.plotters = [f'plotter-{index}' for index in range(plotters)]
+        self.public_keys = [
+            (farmer_id, farm_index, f'{farmer_id}-key-{farm_index}')
+            for farmer_id in self.farmers
+            for farm_index in range(farms_per_farmer)
+        ]
+        self.sector_indexes = {public_key: 0 for _, _, public_key in self.public_keys}
+
+    def tick(self, seconds=1):
+        self.clock += timedelta(seconds=seconds)
+        return self.clock.strftime('%Y-%m-%d %H:%M:%S')
+
+    def containers(self):
+        for container_id in self.farmers + self.plotters:
+            yield {
+                'container_id': container_id,
+                'container_type': 'farmer' if container_id.startswith('farmer') else 'plotter',
+                'container_alias': container_id,
+                'container_status': 'running',
+                'container_image': 'ghcr.io/autonomys/farmer:latest',
+                'container_started_at': self.tick(),
+                'container_is_cluster': 1,
+                'container_ip': f'10.0.{self.random.randint(0, 255)}.{self.random.randint(1, 254)}'
+            }
+
+    def farmer_records(self):
+        for farmer_id in self.farmers:
+            yield {'farmer_id': farmer_id, 'container_id': farmer_id, 'farmer_status': 1}
+
+    def farms(self):
+        for farmer_id, farm_index, public_key in self.public_keys:
+            yield {
+                'farmer_id': farmer_id,
+                'farm_index': farm_index,
+                'farm_public_key': public_key,
+                'farm_size': 4 * 1024 ** 4,
+                'farm_plot_progress': round(self.random.uniform(0, 100), 2)
+            }
+
+    def farm_progress(self):
+        farmer_id, farm_index, _ = self.random.choice(self.public_keys)
+        return {
+            'farmer_id': farmer_id,
+            'farm_index': farm_index,
+            'farm_plot_progress': round(self.random.uniform(0, 100), 2)
+        }
+
+    def event(self):
+        container_id = self.random.choice(self.farmers + self.plotters)
+        return {
+            'event_name': self.random.choice(EVENT_NAMES),
+            'event_type': 'Farmer' if container_id.startswith('farmer') else 'Plotter',
+            'event_level': self.random.choice(EVENT_LEVELS),
+            'event_container_alias': container_id,
+            'event_container_id': container_id,
+            'event_container_type': 'farmer' if container_id.startswith('farmer') else 'plotter',
+            'event_datetime': self.tick(self.random.choice([0, 0, 1])),
+            'event_data': {'farm_index': self.random.randint(0, 7), 'sequence': self.random.random()}
+        }
+
+    def events(self, count):
+        return [self.event() for _ in range(count)]
+
+    def sector_pair(self):
+        # A plotter picks up the next sector of a farm and finishes it a minute or two later
+        _, _, public_key = self.random.choice(self.public_keys)
+        sector_index = self.sector_indexes[public_key]
+        self.sector_indexes[public_key] += 1
+
+        sector = {
+            'sector_index': sector_index,
+            'public_key': public_key,
+            'plotter_id': self.random.choice(self.plotters)
+        }
+        started = dict(sector, complete=0, event_datetime=self.tick())
+        finished = dict(sector, complete=self.random.choice([1] * 19 + [2]), event_datetime=self.tick(self.random.randint(60, 120)))
+        return started, finished
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def summarize(method, scenario, table_size, samples, records=None):
+    elapsed = sum(samples)
+    records = records or len(samples)
+    return {
+        'method': method,
+        'scenario': scenario,
+        'table_size': table_size,
+        'calls': len(samples),
+        'records': records,
+        'throughput_per_second': round(records / elapsed, 1) if elapsed else None,
+        'mean_ms': round(elapsed / len(samples) * 1000, 4),
+        'p50_ms': round(percentile(samples, 50) * 1000, 4),
+        'p99_ms': round(percentile(samples, 99) * 1000, 4)
+    }
+
+
+class Benchmark:
+    def __init__(self, app, fleet, calls):
+        self.app = app
+        self.fleet = fleet
+        self.calls = calls
+        self.results = []
+
+    def call(self, method, *args):
+        # One app context per call, as a request would get, so connection teardown is included
+        with self.app.app_context():
+            started = time.perf_counter()
+            response = method(*args)
+            elapsed = time.perf_counter() - started
+
+        # Batches answer with one result per record
+        for result in response if isinstance(response, list) else [response]:
+            if result.get('status_code', 200) >= 400:
+                raise RuntimeError(f'{method.__name__} failed: {result}')
+
+        return elapsed, response
+
+    def measure(self, name, scenario, table_size, make_args, records=None):
+        samples = []
+        for _ in range(self.calls):
+            samples.append(self.call(getattr(APIDB, name), *make_args())[0])
+
+        self.results.append(summarize(name, scenario, table_size, samples, records and records * self.calls))
+
+    def register(self):
+        for name, records in [
+            ('insert_container', self.fleet.containers()),
+            ('insert_farmer', self.fleet.farmer_records()),
+            ('insert_farm', self.fleet.farms())
+        ]:
+            samples = [self.call(getattr(APIDB, name), record)[0] for record in records]
+            self.results.append(summarize(name, 'register', 0, samples))
+
+    def fill(self, table_size):
+        with self.app.app_context():
+            current = get_db().execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+        samples = []
+        inserted = 0
+        while current + inserted < table_size:
+            count = min(FILL_BATCH_SIZE, table_size - current - inserted)
+            samples.append(self.call(APIDB.insert_batch, 'event', self.fleet.events(count))[0])
+            inserted += count
+
+        if samples:
+            self.results.append(summarize('insert_batch', f'events x{FILL_BATCH_SIZE}', table_size, samples, inserted))
+
+        # Fresh statistics at each size, as the statistics job keeps them in a deployment
+        with self.app.app_context():
+            update_statistics(get_db())
+
+    def sectors(self, table_size):
+        started_samples = []
+        finished_samples = []
+        for _ in range(self.calls):
+            started, finished = self.fleet.sector_pair()
+            started_samples.append(self.call(APIDB.insert_incomplete_sector, started)[0])
+            finished_samples.append(self.call(APIDB.update_complete_sector, finished)[0])
+
+        self.results.append(summarize('insert_incomplete_sector', 'paired', table_size, started_samples))
+        self.results.append(summarize('update_complete_sector', 'paired', table_size, finished_samples))
+
+    def queries(self, table_size):
+        fleet = self.fleet
+
+        self.measure('insert_event', 'single', table_size, lambda: (fleet.event(),))
+        self.measure('insert_farm', 'progress update', table_size, lambda: (fleet.farm_progress(),))
+        self.sectors(table_size)
+
+        self.measure('get_entity', 'first page', table_size, lambda: (
+            'events', 1, 50, {}, None, None, 'event_datetime', 'DESC'
+        ))
+        self.measure('get_entity', 'filtered', table_size, lambda: (
+            'events', 1, 50, {'event_level': fleet.random.choice(EVENT_LEVELS)}, None, None, 'event_id', 'DESC'
+        ))
+        self.measure('get_entity', 'event data filter', table_size, lambda: (
+            'events', 1, 50, {'event_data.farm_index': str(fleet.random.randint(0, 7))}, None, None, 'event_id', 'DESC'
+        ))
+        self.measure('get_entity', 'time window', table_size, lambda: (
+            'events', 1, 50, {}, BASE_TIME.strftime('%Y-%m-%d %H:%M:%S'), fleet.clock.strftime('%Y-%m-%d %H:%M:%S'), 'event_datetime', 'ASC'
+        ))
+        self.measure('get_entity', 'deep page', table_size, lambda: (
+            'events', max(1, table_size // 100), 50, {}, None, None, 'event_id', 'ASC'
+        ))
+
+        # Walk a few pages by cursor, timing each page after the first
+        samples = []
+        for _ in range(max(1, self.calls // 10)):
+            cursor = ''
+            for _ in range(10):
+                elapsed, response = self.call(APIDB.get_entity, 'events', 1, 50, {}, None, None, 'event_datetime', 'DESC', cursor)
+                cursor = response['next_cursor']
+                samples.append(elapsed)
+                if cursor is None:
+                    break
+        self.results.append(summarize('get_entity', 'cursor walk', table_size, samples))
+
+        # A cursor three quarters of the way down should cost the same as the first page
+        with self.app.app_context():
+            row = get_db().execute(
+                "SELECT event_datetime, rowid FROM events ORDER BY event_datetime DESC, rowid DESC LIMIT 1 OFFSET ?",
+                (table_size * 3 // 4,)
+            ).fetchone()
+        if row is not None:
+            deep_cursor = encode_cursor('event_datetime', 'DESC', row[0], row[1])
+            self.measure('get_entity', 'deep cursor', table_size, lambda: (
+                'events', 1, 50, {}, None, None, 'event_datetime', 'DESC', deep_cursor
+            ))
+
+        self.measure('get_sector_stats', 'hourly by plotter', table_size, lambda: (
+            'hour', 'plotter', None, None, None, 1000
+        ))
+
+    def run(self, sizes):
+        self.register()
+        for table_size in sizes:
+            self.fill(table_size)
+            self.queries(table_size)
+        return self.results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current):
+    key = lambda result: (result['method'], result['scenario'], result['table_size'])
+    previous = {key(result): result for result in baseline['results']}
+
+    lines = [f"{'method':<26}{'scenario':<20}{'rows':>8}{'p50 ms':>12}{'p99 ms':>12}{'p99 change':>12}"]
+    for result in current['results']:
+        before = previous.get(key(result))
+        change = ''
+        if before and before['p99_ms']:
+            change = f"{(result['p99_ms'] / before['p99_ms'] - 1) * 100:+.1f}%"
+        lines.append(
+            f"{result['method']:<26}{result['scenario']:<20}{result['table_size']:>8}"
+            f"{result['p50_ms']:>12}{result['p99_ms']:>12}{change:>12}"
+        )
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Spaceport API ingest and query paths')
+    parser.add_argument('--sizes', default='1000,10000,50000', help='comma separated events table sizes to measure at')
+    parser.add_argument('--calls', type=int, default=200, help='calls per measured method and table size')
+    parser.add_argument('--farmers', type=int, default=10)
+    parser.add_argument('--farms-per-farmer', type=int, default=4)
+    parser.add_argument('--plotters', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    parser.add_argument('--compare', help='print a p50/p99 comparison against an earlier results file')
+    args = parser.parse_args(argv)
+
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+    logger.setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({
+            'TESTING': True,
+            'DATABASE': os.path.join(directory, 'benchmark.sqlite'),
+            'METRICS_DIR': os.path.join(directory, 'metrics')
+        })
+        fleet = Fleet(args.seed, args.farmers, args.farms_per_farmer, args.plotters)
+        started = time.perf_counter()
+        results = Benchmark(app, fleet, args.calls).run(sizes)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'sizes': sizes,
+            'calls': args.calls,
+            'duration_seconds': round(time.perf_counter() - started, 2)
+        },
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(json.load(f), report), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()